@@ -1,12 +1,16 @@
 import alarm
 import board
+import gc
 import json
+import microcontroller
+import rtc
 import time
 
 from adafruit_ds3231 import DS3231
 from adafruit_motorkit import MotorKit
 from digitalio import DigitalInOut, Direction, Pull
-from supervisor import runtime
+from supervisor import runtime, ticks_ms
+from watchdog import WatchDogMode
 
 try:
     from typing import Union, Literal
@@ -16,6 +20,8 @@ except ImportError:
 # GLOBAL VARIABLES
 # Implementation dependant things to tweak
 TESTING = True
+BUILD_VARIANT = "plain"  # set by tools/build.py, printed in the BUILD line
+TIMEKEEPING = "ds3231"  # "ds3231" wakes on DS3231 alarms, "mcu" wakes on MCU clock time alarms synced once a day
 DOOR_OPEN_THROTTLE = -1.0  # swinging door open throttle
 DOOR_CLOSE_THROTTLE = 1.0  # swinging door close throttle
 DOOR_OPEN_75_THROTTLE = -0.75  # swinging door open throttle
@@ -28,13 +34,63 @@ LOCK_OPEN_75_THROTTLE = -0.75  # door lock open throttle
 LOCK_CLOSE_75_THROTTLE = 0.75  # door lock close throttle
 LOCK_MIN_TRANSITION_TIME_S = 1.2  # door lock open/close @ 100% duty cycle duration in seconds
 LOCK_75_TRANSITION_TIME_S = 2.4  # door lock open/close @ 75% duty cycle duration in seconds
+REVERSAL_DEAD_TIME_S = 0.1  # motor brake time before driving a part the other way
+MOTOR_RAIL_SETTLE_S = 0.05  # motor driver boost regulator settle time before the first throttle write
 MANUAL_SWITCH_OPEN = True  # manual switch pin state corresponding to door open
 MANUAL_SWITCH_CLOSE = False  # manual switch pin state corresponding to door close
+SWITCH_DEBOUNCE_S = 0.01  # manual switch sample interval while debouncing
+SWITCH_DEBOUNCE_SAMPLES = 5  # consecutive equal samples for a settled manual switch value
+PROVISION_PREFIX = "PROV "  # prefix of a machine-readable provisioning line sent over USB serial
+# constants that can be overridden by calibration.json or a provisioning line
+CALIBRATION_KEYS = ("DOOR_OPEN_THROTTLE", "DOOR_CLOSE_THROTTLE", "DOOR_MIN_TRANSITION_TIME_S",
+                    "LOCK_OPEN_THROTTLE", "LOCK_CLOSE_THROTTLE", "LOCK_MIN_TRANSITION_TIME_S")
+BENCH_STRAP_PIN = None  # pin strapped to ground to start bench mode at power up (e.g. board.D5), None to disable
+BENCH_DEFAULT_CYCLES = 20  # open/close cycles run when bench mode is started by the pin strap
+# wake events, the value is the priority, lower is handled first and later targets override earlier ones
+EVENT_ALARM1 = 0  # DS3231 open alarm
+EVENT_ALARM2 = 1  # DS3231 close alarm
+EVENT_TIME_ALARM = 2  # light sleep motion timer
+EVENT_SWITCH = 3  # debounced manual switch edge
+WATCHDOG_BUDGET_S = 2.0  # max awake time of one state before the watchdog resets the board
+WATCHDOG_MOTION_BUDGET_S = 4.0  # max awake time of the states that start or stop a motor
+WATCHDOG_DEEP_SLEEP_S = 60.0  # budget left running into deep sleep, only a USB powered fake deep sleep outlasts it
+WATCHDOG_BUDGETS_S = {  # per state budget, None for states entered before the watchdog starts (waiting for the user)
+    "initialize": None,
+    "service_lock": WATCHDOG_MOTION_BUDGET_S,
+    "service_door": WATCHDOG_MOTION_BUDGET_S,
+}
+OVERRUN_BACKOFF_COUNT = 3  # overruns without a normal deep sleep in between before only the wake pin can wake us
+ERROR_BLINKS = 30  # led blinks in the error state before deep sleeping
+ERROR_BLINK_S = 1.0  # led on and off time of one error blink
 #                 Jan Feb Mar Apr May Jun Jul Aug Sep Oct Nov Dec
 DAYS_PER_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
+# Sleep memory layout
+LOCK_STATE_RAM_IDX = 0
+DOOR_STATE_RAM_IDX = 1
+LOCK_ELAPSED_S_RAM_IDX = 2
+LOCK_ELAPSED_100TH_S_RAM_IDX = 3
+DOOR_ELAPSED_S_RAM_IDX = 4
+DOOR_ELAPSED_100TH_S_RAM_IDX = 5
+DOOR_TRANSITION_RAM_IDX = 6
+RAM_STATE_RAM_IDX = 7
+OVERRUN_COUNT_RAM_IDX = 8
+OVERRUN_STATE_RAM_IDX = 9
+LAST_SWITCH_RAM_IDX = 10
+SYNC_DAY_RAM_IDX = 11
+NEXT_OPEN_RAM_IDX = 12  # 4 bytes
+NEXT_CLOSE_RAM_IDX = 16  # 4 bytes
+OVERRUN_STREAK_RAM_IDX = 20
+CURRENT_STATE_RAM_IDX = 21
+# current state ids outside the state machine
+DEEP_SLEEP_STATE_ID = 254
+START_UP_STATE_ID = 255
+
+# microcontroller.nvm layout: provisioned schedule and calibration as json, after its little endian length
+NVM_LENGTH_BYTES = 2
+
 # Pins
-MOTOR_DRV_PWR_EN_PIN = board.A0
+MOTOR_DRV_PWR_EN_PIN = board.A0  # needs an external pull-down, keeps the rail off while a reset floats the pin
 MANUAL_SWITCH_STATE_PIN = board.A1
 WAKE_PIN = board.A2
 USB_PWR_STATE_PIN = board.D24
@@ -62,12 +118,118 @@ def log(string: str):
 
 
 def load_schedule():
-    with open("//schedule.json", "r") as sch_obj:
-        schedule = json.load(sch_obj)
+    schedule = load_provisioned().get("schedule")
+    if schedule is None:
+        with open("//schedule.json", "r") as sch_obj:
+            schedule = json.load(sch_obj)
 
     return schedule
 
 
+def load_calibration():
+    calibration = load_provisioned().get("calibration")
+    if calibration is None:
+        try:
+            with open("//calibration.json", "r") as cal_obj:
+                calibration = json.load(cal_obj)
+        except OSError:  # no calibration file, keep the defaults above
+            calibration = {}
+
+    return calibration
+
+
+def apply_calibration(calibration: dict):
+    module_globals = globals()
+    for key in CALIBRATION_KEYS:
+        if key in calibration:
+            module_globals[key] = float(calibration[key])
+
+
+def load_provisioned():
+    """Schedule and calibration saved by a provisioning line, {} if there are none"""
+    nvm = microcontroller.nvm
+    if nvm is None:
+        return {}
+    length = nvm[0] | (nvm[1] << 8)
+    if not length or length > len(nvm) - NVM_LENGTH_BYTES:  # erased flash reads 0xFF
+        return {}
+    try:
+        return json.loads(bytes(nvm[NVM_LENGTH_BYTES:NVM_LENGTH_BYTES + length]).decode())
+    except ValueError:
+        return {}
+
+
+def check_schedule(schedule: dict):
+    """Raise ValueError unless every week alarm_builder can pick has valid open and close times"""
+    for week in range(1, 54):
+        for open_close in ("open", "close"):
+            try:
+                hour = schedule[str(week)][open_close]["h"]
+                minute = schedule[str(week)][open_close]["m"]
+            except (KeyError, TypeError):
+                raise ValueError("schedule has no {} time for week {}".format(open_close, week))
+            if not isinstance(hour, int) or not isinstance(minute, int) or not 0 <= hour <= 23 or \
+                    not 0 <= minute <= 59:
+                raise ValueError("schedule has a bad {} time for week {}".format(open_close, week))
+
+
+def save_provisioned(provisioned: dict):
+    """Write provisioned data to nvm, CIRCUITPY is read-only to code.py while USB has it mounted.
+    Returns False if the board has no nvm or the data does not fit"""
+    nvm = microcontroller.nvm
+    data = json.dumps(provisioned).encode()
+    if nvm is None or len(data) > len(nvm) - NVM_LENGTH_BYTES:
+        return False
+    nvm[0:NVM_LENGTH_BYTES + len(data)] = bytes((len(data) & 0xFF, len(data) >> 8)) + data
+
+    return True
+
+
+def sleep_until_pin_alarm(*alarms):
+    """Cut the motor rail and deep sleep until the wake pin (manual switch or DS3231) or one of alarms"""
+    mtr_drv_pwr.value = False
+    pin_alarm = alarm.pin.PinAlarm(pin=WAKE_PIN, value=False, edge=True, pull=False)
+    alarm.exit_and_deep_sleep_until_alarms(pin_alarm, *alarms)
+
+
+def day_of_week(year: int, month: int, day: int):
+    """Weekday 0 - 6 (Monday - Sunday) for the given date"""
+    return time.localtime(time.mktime(time.struct_time((year, month, day, 0, 0, 0, -1, -1, -1)))).tm_wday
+
+
+def read_switch():
+    """Manual switch value once it held still for SWITCH_DEBOUNCE_SAMPLES samples"""
+    value = man_sw_state.value
+    stable_samples = 1
+    while stable_samples < SWITCH_DEBOUNCE_SAMPLES:
+        time.sleep(SWITCH_DEBOUNCE_S)
+        sample = man_sw_state.value
+        if sample == value:
+            stable_samples += 1
+        else:
+            value = sample
+            stable_samples = 1
+
+    return value
+
+
+def next_alarm(dt: time.struct_time, schedule: dict, open_close: Literal["open", "close"]):
+    """Today's open/close time if it is still ahead of dt, tomorrow's otherwise"""
+    today_alarm = alarm_builder(dt, schedule, open_close, "today")
+    if dt < today_alarm:
+        return today_alarm
+    return alarm_builder(dt, schedule, open_close, "tomorrow")
+
+
+def bench_strapped():
+    if BENCH_STRAP_PIN is None:
+        return False
+
+    with DigitalInOut(BENCH_STRAP_PIN) as strap:
+        strap.switch_to_input(pull=Pull.UP)
+        return not strap.value
+
+
 def alarm_builder(dt: time.struct_time,
                   schedule: dict,
                   open_close: Literal["open", "close"],
@@ -127,6 +289,9 @@ def alarm_builder(dt: time.struct_time,
     return time.struct_time((year, month, day, hour, minute, seconds, weekday, -1, -1))
 
 
+apply_calibration(load_calibration())
+
+
 # VARIABLE TYPE DEFINITION
 class DoorPartState(object):
     """"""
@@ -244,16 +409,380 @@ class ElapsedTime(object):
         alarm.sleep_memory[self._ram_idx_100th_s] = int((elapsed_time_s - int(elapsed_time_s)) * 100)
 
 
+class SwitchState(object):
+    """Last debounced manual switch value, kept in sleep memory to detect edges across deep sleep"""
+
+    def __init__(self, ram_idx: int):
+        self.ram_idx = ram_idx
+
+    @property
+    def value(self):
+        if alarm.sleep_memory[self.ram_idx] == 0:
+            return None  # unknown, power was lost
+        return alarm.sleep_memory[self.ram_idx] == 2
+
+    @value.setter
+    def value(self, value: bool):
+        alarm.sleep_memory[self.ram_idx] = 2 if value else 1
+
+
+class WakeEvents(object):
+    """All pending causes of one wake, ordered by priority, each event at most once"""
+
+    def __init__(self):
+        self.queue = []  # [event, target_open] pairs, target_open is None for events without a target
+
+    def clear(self):
+        self.queue = []
+
+    def add(self, event: int, target_open: Union[bool, None]):
+        self.remove(event)
+        idx = 0
+        while idx < len(self.queue) and self.queue[idx][0] < event:
+            idx += 1
+        self.queue.insert(idx, [event, target_open])
+
+    def remove(self, event: int):
+        self.queue = [pending for pending in self.queue if pending[0] != event]
+
+    def has(self, event: int):
+        for pending in self.queue:
+            if pending[0] == event:
+                return True
+        return False
+
+    def target_open(self):
+        """Final door target after handling the queue in order, None if no event changes it"""
+        target_open = None
+        for pending in self.queue:
+            if pending[1] is not None:
+                target_open = pending[1]
+        return target_open
+
+
+class EpochTime(object):
+    """Unsigned 32 bit epoch time in four sleep memory bytes, 0 when unset"""
+
+    def __init__(self, ram_idx: int):
+        self.ram_idx = ram_idx
+
+    @property
+    def value(self):
+        value = 0
+        for byte_idx in range(4):
+            value |= alarm.sleep_memory[self.ram_idx + byte_idx] << (8 * byte_idx)
+        return value
+
+    @value.setter
+    def value(self, value: int):
+        for byte_idx in range(4):
+            alarm.sleep_memory[self.ram_idx + byte_idx] = (value >> (8 * byte_idx)) & 0xFF
+
+
+class OverrunLog(object):
+    """Watchdog overruns kept in sleep memory: the total, the ones since the last normal deep sleep and the id of the
+    state that overran last. The id of the current state is kept too, a watchdog reset gives no chance to save it"""
+
+    def __init__(self, ram_idx_count: int, ram_idx_streak: int, ram_idx_state: int, ram_idx_current_state: int):
+        self._ram_idx_count = ram_idx_count
+        self._ram_idx_streak = ram_idx_streak
+        self._ram_idx_state = ram_idx_state
+        self._ram_idx_current_state = ram_idx_current_state
+
+    @property
+    def count(self):
+        return alarm.sleep_memory[self._ram_idx_count]
+
+    @property
+    def streak(self):
+        return alarm.sleep_memory[self._ram_idx_streak]
+
+    @property
+    def state_id(self):
+        return alarm.sleep_memory[self._ram_idx_state]
+
+    @property
+    def current_state_id(self):
+        return alarm.sleep_memory[self._ram_idx_current_state]
+
+    def enter(self, state_id: int):
+        alarm.sleep_memory[self._ram_idx_current_state] = state_id
+
+    def record(self):
+        alarm.sleep_memory[self._ram_idx_count] = min(self.count + 1, 255)
+        alarm.sleep_memory[self._ram_idx_streak] = min(self.streak + 1, 255)
+        alarm.sleep_memory[self._ram_idx_state] = alarm.sleep_memory[self._ram_idx_current_state]
+
+    def clear_streak(self):
+        if self.streak:
+            alarm.sleep_memory[self._ram_idx_streak] = 0
+
+
+class Stat(object):
+    """Running min/avg/max of a bench measurement"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        if not self.count or value < self.min:
+            self.min = value
+        if not self.count or value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        avg = self.total / self.count if self.count else 0.0
+        return "{:.3f}/{:.3f}/{:.3f}".format(self.min, avg, self.max)
+
+
+class Bench(object):
+    """Endurance bench run, only lives in RAM since it never deep sleeps"""
+
+    def __init__(self):
+        self.is_active = False
+        self.cycles = 0
+        self.cycle = 0
+        self.reverse_every = 0  # inject a switch reversal every n-th cycle, 0 to never reverse
+        self.reverse_after_s = 0.0  # seconds into the cycle the reversal is injected
+        self.reversals = 0
+        self.target_open = True
+        self.is_reversed = False
+        self.is_reverse_pending = False
+        self.cycle_start_time = 0.0
+        self.command_time = 0.0  # time of the last open/close command, 0 once the motor started
+        self.wake_time = 0.0
+        self.wake_latency = Stat()  # command to motor running and back asleep
+        self.motion = Stat()  # command to door and lock settled
+        self.sleep_overshoot = Stat()  # light sleep wake up past the requested time
+        self.awake = Stat()  # awake time of each wake during a cycle
+        self.rail_on = Stat()  # motor rail on time of a cycle
+        self.cycle_rail_on_s = 0.0  # motor rail on time total at the start of the cycle
+
+    def start(self, cycles: int, reverse_every: int = 0, reverse_after_s: float = 0.0):
+        self.__init__()
+        self.is_active = True
+        self.cycles = cycles
+        self.reverse_every = reverse_every
+        self.reverse_after_s = reverse_after_s
+
+    def reverse_in(self, now: float):
+        """Seconds until a reversal should be injected in this cycle, None if there is none"""
+        if self.is_reversed or not self.reverse_every or self.cycle % self.reverse_every:
+            return None
+        return max(self.cycle_start_time + self.reverse_after_s - now, 0.0)
+
+    def report(self):
+        print("BENCH cycles={} reversals={}".format(self.cycle, self.reversals))
+        print("BENCH min/avg/max s")
+        print("BENCH wake_latency {}".format(self.wake_latency.summary()))
+        print("BENCH motion {}".format(self.motion.summary()))
+        print("BENCH sleep_overshoot {}".format(self.sleep_overshoot.summary()))
+        print("BENCH awake {}".format(self.awake.summary()))
+        print("BENCH rail_on {}".format(self.rail_on.summary()))
+
+
+class MotorRail(object):
+    """Motor driver boost regulator, on only while at least one motor has a throttle"""
+
+    def __init__(self, enable_pin: DigitalInOut):
+        self.enable_pin = enable_pin
+        self.active_motors = 0
+        self.on_time = 0.0
+        self.on_s = 0.0  # total rail on time since the last deep sleep
+
+    def acquire(self):
+        if not self.active_motors:
+            self.enable_pin.value = True
+            self.on_time = time.monotonic()
+            time.sleep(MOTOR_RAIL_SETTLE_S)
+        self.active_motors += 1
+
+    def release(self):
+        if not self.active_motors:
+            return
+        self.active_motors -= 1
+        if not self.active_motors:
+            self.enable_pin.value = False
+            self.on_s += time.monotonic() - self.on_time
+            log("motor rail on time: {}".format(self.on_s))
+
+
 class DoorPart(object):
     """"""
 
     def __init__(self, state_ram_idx: int,
                  elapsed_time_ram_idx_s: int,
                  elapsed_time_ram_idx_100th_s: int,
-                 motor: Union[MotorKit.motor1, MotorKit.motor2, MotorKit.motor3, MotorKit.motor4]):
+                 motor: Union[MotorKit.motor1, MotorKit.motor2, MotorKit.motor3, MotorKit.motor4],
+                 rail: MotorRail):
         self.state = DoorPartState(ram_idx=state_ram_idx)
         self.elapsed_time = ElapsedTime(ram_idx_s=elapsed_time_ram_idx_s, ram_idx_100th_s=elapsed_time_ram_idx_100th_s)
         self.motor = motor
+        self.rail = rail
+        self._throttle = None  # the motor driver is reset to coasting at every start up
+
+    @property
+    def throttle(self):
+        return self._throttle
+
+    @throttle.setter
+    def throttle(self, throttle: Union[float, None]):
+        if throttle is not None and self._throttle is None:
+            self.rail.acquire()
+        self.motor.throttle = throttle
+        if throttle is None and self._throttle is not None:
+            self.rail.release()
+        self._throttle = throttle
+
+    def reverse(self, to_open: bool, throttle: float, transition_time_s: float, elapsed_time_s: float):
+        """Drive the other way after a short brake, returns the travel time back to where the move started"""
+        travelled_s = min(elapsed_time_s, transition_time_s)
+        self.elapsed_time.sec = transition_time_s - travelled_s  # the way back counts as progress of the new move
+        if to_open:
+            self.state.set_opening()
+        else:
+            self.state.set_closing()
+        self.throttle = 0  # brake, keeps the motor rail up
+        time.sleep(REVERSAL_DEAD_TIME_S)
+        self.throttle = throttle
+        return travelled_s
+
+
+# TIMEKEEPING
+# Both backends have the same interface: datetime, arm(), pending_alarms(), rearm() and sleep_alarms(), which returns
+# the alarms to deep sleep on or None when an open/close time is already due.
+# i2c_accesses counts DS3231 register accesses for comparing the backends.
+class Ds3231Timekeeper(object):
+    """Open/close alarms kept by the DS3231, raised on the shared wake pin"""
+
+    def __init__(self, ds3231: DS3231):
+        self.ds3231 = ds3231
+        self.i2c_accesses = 0
+
+    @property
+    def datetime(self):
+        self.i2c_accesses += 1
+        return self.ds3231.datetime
+
+    @datetime.setter
+    def datetime(self, dt: time.struct_time):
+        self.i2c_accesses += 1
+        self.ds3231.datetime = dt
+
+    def arm(self, dt: time.struct_time, schedule: dict):
+        self.i2c_accesses += 4
+        self.ds3231.alarm1 = (next_alarm(dt, schedule, "open"), "daily")
+        self.ds3231.alarm2 = (next_alarm(dt, schedule, "close"), "daily")
+        self.ds3231.alarm1_interrupt = True
+        self.ds3231.alarm2_interrupt = True
+
+    def pending_alarms(self):
+        self.i2c_accesses += 2
+        return self.ds3231.alarm1_status, self.ds3231.alarm2_status
+
+    def rearm(self, open_close: Literal["open", "close"], dt: time.struct_time, schedule: dict):
+        self.i2c_accesses += 2
+        if open_close == "open":
+            self.ds3231.alarm1_status = False
+            self.ds3231.alarm1 = (alarm_builder(dt, schedule, "open", "tomorrow"), "daily")
+        else:
+            self.ds3231.alarm2_status = False
+            self.ds3231.alarm2 = (alarm_builder(dt, schedule, "close", "tomorrow"), "daily")
+
+    def sleep_alarms(self):
+        return []  # the DS3231 wakes us through the pin alarm
+
+
+class McuTimekeeper(object):
+    """Open/close times kept as MCU clock time alarms, the DS3231 is only read to correct drift once a day. The DS3231
+    alarms stay armed on the wake pin as a backup"""
+
+    def __init__(self, ds3231: DS3231, sync_day_ram_idx: int, next_open_ram_idx: int, next_close_ram_idx: int):
+        self.ds3231 = ds3231
+        self.mcu_rtc = rtc.RTC()
+        self.sync_day_ram_idx = sync_day_ram_idx
+        self.next_open = EpochTime(ram_idx=next_open_ram_idx)
+        self.next_close = EpochTime(ram_idx=next_close_ram_idx)
+        self.i2c_accesses = 0
+
+    def _sync(self):
+        self.i2c_accesses += 1
+        dt = self.ds3231.datetime
+        self.mcu_rtc.datetime = dt
+        alarm.sleep_memory[self.sync_day_ram_idx] = dt.tm_mday
+        print("synced mcu clock from ds3231")
+
+    @property
+    def datetime(self):
+        now = time.localtime()
+        # the mcu clock starts at 2000 after power up, the ds3231 keeps running on its battery
+        if now.tm_year == 2000 or now.tm_mday != alarm.sleep_memory[self.sync_day_ram_idx]:
+            self._sync()
+            now = time.localtime()
+        return now
+
+    @datetime.setter
+    def datetime(self, dt: time.struct_time):
+        self.i2c_accesses += 1
+        self.ds3231.datetime = dt
+        self.mcu_rtc.datetime = dt
+        alarm.sleep_memory[self.sync_day_ram_idx] = dt.tm_mday
+
+    def arm(self, dt: time.struct_time, schedule: dict):
+        self.i2c_accesses += 4
+        next_open = next_alarm(dt, schedule, "open")
+        next_close = next_alarm(dt, schedule, "close")
+        self.ds3231.alarm1 = (next_open, "daily")
+        self.ds3231.alarm2 = (next_close, "daily")
+        self.ds3231.alarm1_interrupt = True
+        self.ds3231.alarm2_interrupt = True
+        self.next_open.value = time.mktime(next_open)
+        self.next_close.value = time.mktime(next_close)
+
+    def _restore(self):
+        """Arm again from the DS3231 time if a power loss cleared the open/close times with the sleep memory"""
+        if not self.next_open.value or not self.next_close.value:
+            print("mcu alarms lost, arming again from the ds3231")
+            self.arm(self.datetime, load_schedule())
+
+    def pending_alarms(self):
+        self.datetime  # sync first if due
+        self._restore()
+        now = time.time()
+        alarm1_pending = self.next_open.value <= now
+        alarm2_pending = self.next_close.value <= now
+        if isinstance(alarm.wake_alarm, alarm.pin.PinAlarm):
+            # the backup alarms share the wake pin with the manual switch
+            self.i2c_accesses += 2
+            alarm1_pending = alarm1_pending or self.ds3231.alarm1_status
+            alarm2_pending = alarm2_pending or self.ds3231.alarm2_status
+        return alarm1_pending, alarm2_pending
+
+    def rearm(self, open_close: Literal["open", "close"], dt: time.struct_time, schedule: dict):
+        # moving the backup alarm to tomorrow also drops it if the DS3231 is behind and has not fired yet
+        self.i2c_accesses += 2
+        if open_close == "open":
+            tomorrow = alarm_builder(dt, schedule, "open", "tomorrow")
+            self.ds3231.alarm1_status = False
+            self.ds3231.alarm1 = (tomorrow, "daily")
+            self.next_open.value = time.mktime(tomorrow)
+        else:
+            tomorrow = alarm_builder(dt, schedule, "close", "tomorrow")
+            self.ds3231.alarm2_status = False
+            self.ds3231.alarm2 = (tomorrow, "daily")
+            self.next_close.value = time.mktime(tomorrow)
+
+    def sleep_alarms(self):
+        self._restore()
+        epoch = min(self.next_open.value, self.next_close.value)
+        if epoch <= time.time():
+            return None  # TimeAlarm raises ValueError for a time in the past
+        return [alarm.time.TimeAlarm(epoch_time=epoch)]
 
 
 # STATE MACHINE DEFINITION
@@ -261,29 +790,52 @@ class StateMachine(object):
     """"""
 
     def __init__(self):
+        # bound the time a hung I2C transaction can keep us awake from here on, unless this start up may end at the
+        # initialize prompt: a RESET mode watchdog can't be stopped again
+        if alarm.wake_alarm is not None:
+            self.supervise(WATCHDOG_BUDGET_S)
+
         # INITIALIZE COMMUNICATION PROTOCOL
         i2c = board.I2C()
         # spi = board.SPI()
 
         # INITIALIZE MODULES
         self.rtc = DS3231(i2c=i2c)
+        if TIMEKEEPING == "mcu":
+            self.timekeeper = McuTimekeeper(self.rtc,
+                                            sync_day_ram_idx=SYNC_DAY_RAM_IDX,
+                                            next_open_ram_idx=NEXT_OPEN_RAM_IDX,
+                                            next_close_ram_idx=NEXT_CLOSE_RAM_IDX)
+        else:
+            self.timekeeper = Ds3231Timekeeper(self.rtc)
         motor = MotorKit(i2c=i2c)
 
         # INITIALIZE VARIABLES
         self.state = None
         self.states = {}
+        self.state_names = []  # index is the state id recorded by the overrun log
 
         self.switch_state = man_sw_state.value  # get pin value at initialization
-        self.lock = DoorPart(state_ram_idx=0,
-                             elapsed_time_ram_idx_s=2,
-                             elapsed_time_ram_idx_100th_s=3,
-                             motor=motor.motor2)
-        self.door = DoorPart(state_ram_idx=1,
-                             elapsed_time_ram_idx_s=4,
-                             elapsed_time_ram_idx_100th_s=5,
-                             motor=motor.motor1)
-        self.door_transition_state = DoorTransitioningState(ram_idx=6)
-        self.ram_state = RamState(ram_idx=7)
+        self.last_switch_state = SwitchState(ram_idx=LAST_SWITCH_RAM_IDX)
+        self.wake_events = WakeEvents()
+        self.motor_rail = MotorRail(enable_pin=mtr_drv_pwr)
+        self.lock = DoorPart(state_ram_idx=LOCK_STATE_RAM_IDX,
+                             elapsed_time_ram_idx_s=LOCK_ELAPSED_S_RAM_IDX,
+                             elapsed_time_ram_idx_100th_s=LOCK_ELAPSED_100TH_S_RAM_IDX,
+                             motor=motor.motor2,
+                             rail=self.motor_rail)
+        self.door = DoorPart(state_ram_idx=DOOR_STATE_RAM_IDX,
+                             elapsed_time_ram_idx_s=DOOR_ELAPSED_S_RAM_IDX,
+                             elapsed_time_ram_idx_100th_s=DOOR_ELAPSED_100TH_S_RAM_IDX,
+                             motor=motor.motor1,
+                             rail=self.motor_rail)
+        self.door_transition_state = DoorTransitioningState(ram_idx=DOOR_TRANSITION_RAM_IDX)
+        self.ram_state = RamState(ram_idx=RAM_STATE_RAM_IDX)
+        self.overrun_log = OverrunLog(ram_idx_count=OVERRUN_COUNT_RAM_IDX,
+                                      ram_idx_streak=OVERRUN_STREAK_RAM_IDX,
+                                      ram_idx_state=OVERRUN_STATE_RAM_IDX,
+                                      ram_idx_current_state=CURRENT_STATE_RAM_IDX)
+        self.bench = Bench()
 
         self.go_to_sleep_time = 0
         self.sleep_duration_s = 0
@@ -291,6 +843,7 @@ class StateMachine(object):
 
     def add_state(self, state):
         self.states[state.name] = state
+        self.state_names.append(state.name)
 
     def go_to_state(self, state_name):
         if self.state:
@@ -298,8 +851,28 @@ class StateMachine(object):
             self.state.exit(self)
         self.state = self.states[state_name]
         log("Entering {}".format(self.state.name))
+        self.overrun_log.enter(self.state_names.index(state_name))
+        self.supervise(WATCHDOG_BUDGETS_S.get(state_name, WATCHDOG_BUDGET_S))
         self.state.enter(self)
 
+    @staticmethod
+    def supervise(budget_s: float):
+        """Start or restart the watchdog with a new budget, None leaves a stopped watchdog stopped"""
+        if budget_s is None:
+            return
+        microcontroller.watchdog.timeout = budget_s
+        if microcontroller.watchdog.mode is None:
+            # RAISE would wait for the VM, a hung I2C transaction never gets back to it
+            microcontroller.watchdog.mode = WatchDogMode.RESET
+        microcontroller.watchdog.feed()
+
+    def prepare_deep_sleep(self):
+        """The watchdog can't be stopped, deep sleep resets the chip anyway. Only a fake deep sleep on USB power lasts
+        long enough for it to reset us, that is not counted as an overrun"""
+        self.overrun_log.enter(DEEP_SLEEP_STATE_ID)
+        if microcontroller.watchdog.mode is not None:
+            self.supervise(WATCHDOG_DEEP_SLEEP_S)
+
     def execute(self):
         if self.state:
             log("executing {}".format(self.state.name))
@@ -344,44 +917,86 @@ class Initialize(State):
         State.exit(self, machine)
 
     def execute(self, machine: StateMachine):
-        # get today's date, weekday, current time from user
-        date = input("Enter date using the MM/DD/YYYY format: ").split("/")
-        year = int(date[2])
-        month = int(date[0])
-        day = int(date[1])
-        weekday = input("Enter weekday 0 - 6 (Monday - Sunday): ")
-        weekday = int(weekday)
-        current_time = input("Enter time using the HH:MM:SS format: ").split(":")
-        hour = int(current_time[0])
-        minute = int(current_time[1])
-        second = int(current_time[2])
-
-        # initialize rtc
-        dt = time.struct_time((year, month, day, hour, minute, second, weekday, -1, -1))
-        machine.rtc.datetime = dt
-
-        schedule = load_schedule()
-
-        today_alarm1 = alarm_builder(dt, schedule, "open", "today")
-        today_alarm2 = alarm_builder(dt, schedule, "close", "today")
-        tomorrow_alarm1 = alarm_builder(dt, schedule, "open", "tomorrow")
-        tomorrow_alarm2 = alarm_builder(dt, schedule, "close", "tomorrow")
-
-        if dt < today_alarm1:
-            machine.rtc.alarm1 = (today_alarm1, "daily")
+        # get today's date from user, or a whole provisioning line from the host tool
+        line = input("Enter date using the MM/DD/YYYY format: ").strip()
+        if line.startswith(PROVISION_PREFIX):
+            try:
+                bench = self._provision(machine, json.loads(line[len(PROVISION_PREFIX):]))
+            except (ValueError, KeyError, IndexError, TypeError) as err:
+                print("PROV ERR {}".format(err))
+                return  # stay in initialize and prompt again
+
+            if bench is not None:
+                # stay on USB, the bench report is read over serial
+                machine.bench.start(*bench)
+                machine.go_to_state("bench")
+                return
         else:
-            machine.rtc.alarm1 = (tomorrow_alarm1, "daily")
+            try:
+                date = line.split("/")
+                year = int(date[2])
+                month = int(date[0])
+                day = int(date[1])
+                weekday = input("Enter weekday 0 - 6 (Monday - Sunday): ")
+                weekday = int(weekday)
+                current_time = input("Enter time using the HH:MM:SS format: ").split(":")
+                hour = int(current_time[0])
+                minute = int(current_time[1])
+                second = int(current_time[2])
+                dt = time.struct_time((year, month, day, hour, minute, second, weekday, -1, -1))
+
+                # get door state from user
+                door_lock_state = int(input("Enter Door and Lock state (0=Closed, 1=Open): "))
+            except (ValueError, IndexError) as err:
+                print("invalid input: {}, try again".format(err))
+                return  # stay in initialize and prompt again
+
+            self._setup(machine, dt, door_lock_state, load_schedule())
 
-        if dt < today_alarm2:
-            machine.rtc.alarm2 = (today_alarm2, "daily")
-        else:
-            machine.rtc.alarm2 = (tomorrow_alarm2, "daily")
+        # wait for user to unplug usb
+        print("Please remove USB...")
+        while runtime.serial_connected:
+            time.sleep(0.5)
 
-        machine.rtc.alarm1_interrupt = True
-        machine.rtc.alarm2_interrupt = True
+        machine.go_to_state("waiting")
 
-        # get door state from user
-        door_lock_state = int(input("Enter Door and Lock state (0=Closed, 1=Open): "))
+    def _provision(self, machine: StateMachine, payload: dict):
+        """Apply a provisioning payload: {"dt": [Y, M, D, h, m, s], "door": 0|1, "schedule": {}, "calibration": {},
+        "bench": {"cycles": n, "reverse_every": n, "reverse_after_s": s}}, returns the bench arguments or None"""
+        year, month, day, hour, minute, second = payload["dt"]
+        weekday = day_of_week(year, month, day)
+        dt = time.struct_time((year, month, day, hour, minute, second, weekday, -1, -1))
+        door_lock_state = int(payload["door"])
+
+        # check everything before saving, a broken schedule or calibration in nvm would fail every later wake
+        bench = None
+        if "bench" in payload:
+            if not isinstance(payload["bench"], dict):
+                raise ValueError("bench is not an object")
+            bench = (int(payload["bench"].get("cycles", BENCH_DEFAULT_CYCLES)),
+                     int(payload["bench"].get("reverse_every", 0)),
+                     float(payload["bench"].get("reverse_after_s", 0.0)))
+        provisioned = load_provisioned()
+        if "calibration" in payload:
+            if not isinstance(payload["calibration"], dict):
+                raise ValueError("calibration is not an object")
+            provisioned["calibration"] = {key: float(payload["calibration"][key])
+                                          for key in CALIBRATION_KEYS if key in payload["calibration"]}
+        if "schedule" in payload:
+            check_schedule(payload["schedule"])
+            provisioned["schedule"] = payload["schedule"]
+        if ("calibration" in payload or "schedule" in payload) and not save_provisioned(provisioned):
+            raise ValueError("schedule and calibration do not fit in nvm")
+
+        apply_calibration(load_calibration())
+        self._setup(machine, dt, door_lock_state, load_schedule())
+        print("PROV OK {}".format(weekday))
+        return bench
+
+    def _setup(self, machine: StateMachine, dt: time.struct_time, door_lock_state: int, schedule: dict):
+        # initialize rtc
+        machine.timekeeper.datetime = dt
+        machine.timekeeper.arm(dt, schedule)
 
         # set door state
         if door_lock_state == 0:
@@ -391,15 +1006,9 @@ class Initialize(State):
             machine.door.state.set_open()
             machine.lock.state.set_open()
 
+        machine.last_switch_state.value = read_switch()
         machine.ram_state.set_retained()
 
-        # wait for user to unplug usb
-        print("Please remove USB...")
-        while runtime.serial_connected:
-            time.sleep(0.5)
-
-        machine.go_to_state("waiting")
-
 
 class Waiting(State):
     """Wait for something to initiate wakeup"""
@@ -419,21 +1028,65 @@ class Waiting(State):
 
     def execute(self, machine: StateMachine):
         led.value = False
+        bench = machine.bench
         pin_alarm = alarm.pin.PinAlarm(pin=WAKE_PIN, value=False, edge=True, pull=False)
         if not machine.door_transition_state.is_none:  # do a light sleep if we are in the middle of opening or closing
             print("doing light sleep")
             print("sleep time: {}".format(machine.sleep_duration_s))
             machine.go_to_sleep_time = time.monotonic()
             print("monotonic time before sleep: {}".format(machine.go_to_sleep_time))
-            time_alarm = alarm.time.TimeAlarm(monotonic_time=(time.monotonic() + machine.sleep_duration_s))
+            sleep_duration_s = machine.sleep_duration_s
+            if bench.is_active:
+                self._bench_before_sleep(bench, machine.go_to_sleep_time)
+                reverse_in = bench.reverse_in(machine.go_to_sleep_time)
+                if reverse_in is not None and reverse_in < sleep_duration_s:
+                    sleep_duration_s = reverse_in
+                    bench.is_reverse_pending = True
+            time_alarm = alarm.time.TimeAlarm(monotonic_time=(time.monotonic() + sleep_duration_s))
+            machine.supervise(sleep_duration_s + WATCHDOG_BUDGET_S)
             alarm.light_sleep_until_alarms(time_alarm, pin_alarm)
+            if bench.is_active:
+                bench.wake_time = time.monotonic()
+                bench.sleep_overshoot.add(bench.wake_time - machine.go_to_sleep_time - sleep_duration_s)
+        elif bench.is_active:  # no deep sleep in between bench cycles
+            self._bench_before_sleep(bench, time.monotonic())
+            machine.go_to_state("bench")
+            return
         else:
+            sleep_alarms = machine.timekeeper.sleep_alarms()
+            if sleep_alarms is None:
+                print("open/close time passed while awake")
+                machine.go_to_state("get_reason_for_wake_up")
+                return
             print("doing deep sleep")
-            alarm.exit_and_deep_sleep_until_alarms(pin_alarm)
+            log("ds3231 accesses this wake: {}".format(machine.timekeeper.i2c_accesses))
+            machine.prepare_deep_sleep()
+            machine.overrun_log.clear_streak()
+            alarm.exit_and_deep_sleep_until_alarms(pin_alarm, *sleep_alarms)
 
         # if we got here, it was a light sleep
         led.value = True
-        machine.go_to_state("get_reason_for_wake_up")
+        if bench.is_reverse_pending:
+            # act like the switch was flipped mid motion
+            bench.is_reverse_pending = False
+            bench.is_reversed = True
+            bench.reversals += 1
+            bench.target_open = not bench.target_open
+            bench.command_time = bench.wake_time
+            if bench.target_open:
+                machine.door_transition_state.set_open()
+            else:
+                machine.door_transition_state.set_close()
+            machine.go_to_state("wake_up")
+        else:
+            machine.go_to_state("get_reason_for_wake_up")
+
+    @staticmethod
+    def _bench_before_sleep(bench: Bench, now: float):
+        bench.awake.add(now - bench.wake_time)
+        if bench.command_time:
+            bench.wake_latency.add(now - bench.command_time)
+            bench.command_time = 0.0
 
 
 class GetReasonForWakeUp(State):
@@ -453,23 +1106,63 @@ class GetReasonForWakeUp(State):
         State.exit(self, machine)
 
     def execute(self, machine: StateMachine):
-        time.sleep(0.05)  # let switch value settle
-        machine.switch_state = man_sw_state.value
+        events = machine.wake_events
+        events.clear()
+        machine.switch_state = read_switch()
         print("switch value: {}".format(machine.switch_state))
 
-        if machine.rtc.alarm1_status or machine.rtc.alarm2_status:
+        # collect every pending cause, not just the first one found
+        alarm1_pending, alarm2_pending = machine.timekeeper.pending_alarms()
+        if alarm1_pending:
+            events.add(EVENT_ALARM1, True)
+        if alarm2_pending:
+            events.add(EVENT_ALARM2, False)
+        if isinstance(alarm.wake_alarm, alarm.time.TimeAlarm):
+            events.add(EVENT_TIME_ALARM, None)
+        if machine.switch_state != machine.last_switch_state.value:
+            events.add(EVENT_SWITCH, machine.switch_state == MANUAL_SWITCH_OPEN)
+
+        if events.has(EVENT_ALARM1) or events.has(EVENT_ALARM2):
             machine.go_to_state("service_rtc")
-        elif isinstance(alarm.wake_alarm, alarm.time.TimeAlarm):
-            print("woke up due to time alarm")
-            machine.go_to_state("wake_up")
-        elif machine.switch_state == MANUAL_SWITCH_OPEN:
-            print("woke up due to switch it is: True")
-            machine.door_transition_state.set_open()
-            machine.go_to_state("wake_up")
         else:
-            print("woke up due to switch it is: False")
+            machine.go_to_state("settle_wake_events")
+
+
+class SettleWakeEvents(State):
+    """Set the door target the wake events settle on, once per wake"""
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "settle_wake_events"
+
+    def enter(self, machine):
+        State.enter(self, machine)
+
+    def exit(self, machine):
+        State.exit(self, machine)
+
+    def execute(self, machine: StateMachine):
+        print("wake events: {}".format(machine.wake_events.queue))
+        target_open = machine.wake_events.target_open()
+
+        if target_open is None:
+            if machine.door_transition_state.is_none:
+                print("nothing to do")
+                machine.go_to_state("waiting")
+                return
+        elif target_open and not machine.door_transition_state.is_open:
+            machine.door_transition_state.set_open()
+        elif not target_open and not machine.door_transition_state.is_close:
             machine.door_transition_state.set_close()
-            machine.go_to_state("wake_up")
+
+        if machine.wake_events.has(EVENT_SWITCH):
+            # consume the edge only once its target is stored, a reset in between sees the edge again
+            machine.last_switch_state.value = machine.switch_state
+
+        machine.go_to_state("wake_up")
 
 
 class WakeUp(State):
@@ -527,22 +1220,26 @@ class ServiceRtc(State):
         State.exit(self, machine)
 
     def execute(self, machine: StateMachine):
-        dt = machine.rtc.datetime  # get current dt
+        dt = machine.timekeeper.datetime  # get current dt
         schedule = load_schedule()  # load schedule
+        events = machine.wake_events
 
-        if machine.rtc.alarm1_status:
+        if events.has(EVENT_ALARM1):
             # morning alarm went off
-            machine.rtc.alarm1_status = False
-            machine.rtc.alarm1 = (alarm_builder(dt, schedule, "open", "tomorrow"), "daily")
-            machine.door_transition_state.set_open()
+            machine.timekeeper.rearm("open", dt, schedule)
 
-        else:
+        if events.has(EVENT_ALARM2):
             # night alarm went off
-            machine.rtc.alarm2_status = False
-            machine.rtc.alarm2 = (alarm_builder(dt, schedule, "close", "tomorrow"), "daily")
-            machine.door_transition_state.set_close()
+            machine.timekeeper.rearm("close", dt, schedule)
 
-        machine.go_to_state("wake_up")
+        if events.has(EVENT_ALARM1) and events.has(EVENT_ALARM2):
+            # both missed, only the one that went off last still matters
+            if alarm_builder(dt, schedule, "open", "today") <= dt < alarm_builder(dt, schedule, "close", "today"):
+                events.remove(EVENT_ALARM2)
+            else:
+                events.remove(EVENT_ALARM1)
+
+        machine.go_to_state("settle_wake_events")
 
 
 class ServiceLock(State):
@@ -562,7 +1259,6 @@ class ServiceLock(State):
         State.exit(self, machine)
 
     def execute(self, machine: StateMachine):
-        mtr_drv_pwr.value = True
         elapsed_time_s = machine.lock.elapsed_time.sec + time.monotonic() - machine.go_to_sleep_time
         print("time after sleep: {}".format(time.monotonic()))
         print("elapsed time: {}".format(elapsed_time_s))
@@ -573,7 +1269,7 @@ class ServiceLock(State):
                 machine.lock.elapsed_time.sec = 0.0
                 machine.lock.state.set_opening()
                 machine.sleep_duration_s = LOCK_MIN_TRANSITION_TIME_S
-                machine.lock.motor.throttle = LOCK_OPEN_THROTTLE
+                machine.lock.throttle = LOCK_OPEN_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_opening and elapsed_time_s < LOCK_MIN_TRANSITION_TIME_S:
                 print("lock 1")
@@ -584,27 +1280,25 @@ class ServiceLock(State):
                 print("lock 2")
                 machine.lock.elapsed_time.sec = 0.0
                 machine.lock.state.set_open()
-                machine.lock.motor.throttle = None
+                machine.lock.throttle = None
                 machine.go_to_state("service_door")
             elif machine.lock.state.is_closing:
                 print("lock 3")
-                machine.lock.elapsed_time.sec = elapsed_time_s
-                mtr_drv_pwr.value = False
-                machine.lock.state.set_paused_closing()
-                machine.door_transition_state.set_none()
-                machine.lock.motor.throttle = None
+                machine.sleep_duration_s = machine.lock.reverse(True, LOCK_OPEN_THROTTLE, LOCK_MIN_TRANSITION_TIME_S,
+                                                                elapsed_time_s)
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_paused_closing:
                 print("lock 4")
                 machine.sleep_duration_s = machine.lock.elapsed_time.sec
+                machine.lock.elapsed_time.sec = LOCK_MIN_TRANSITION_TIME_S - machine.sleep_duration_s
                 machine.lock.state.set_opening()
-                machine.lock.motor.throttle = LOCK_OPEN_THROTTLE
+                machine.lock.throttle = LOCK_OPEN_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_paused_opening:
                 print("lock 5")
                 machine.sleep_duration_s = LOCK_MIN_TRANSITION_TIME_S - machine.lock.elapsed_time.sec
                 machine.lock.state.set_opening()
-                machine.lock.motor.throttle = LOCK_OPEN_THROTTLE
+                machine.lock.throttle = LOCK_OPEN_THROTTLE
                 machine.go_to_state("waiting")
         elif machine.door_transition_state.is_close:
             if machine.lock.state.is_open:
@@ -612,7 +1306,7 @@ class ServiceLock(State):
                 machine.lock.elapsed_time.sec = 0.0
                 machine.lock.state.set_closing()
                 machine.sleep_duration_s = LOCK_MIN_TRANSITION_TIME_S
-                machine.lock.motor.throttle = LOCK_CLOSE_THROTTLE
+                machine.lock.throttle = LOCK_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_closing and elapsed_time_s < LOCK_MIN_TRANSITION_TIME_S:
                 print("lock 7")
@@ -622,30 +1316,27 @@ class ServiceLock(State):
             elif machine.lock.state.is_closing and elapsed_time_s > LOCK_MIN_TRANSITION_TIME_S:
                 print("lock 8")
                 machine.lock.elapsed_time.sec = 0.0
-                mtr_drv_pwr.value = False
                 machine.lock.state.set_closed()
                 machine.door_transition_state.set_none()
-                machine.lock.motor.throttle = None
+                machine.lock.throttle = None
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_opening:
                 print("lock 9")
-                machine.lock.elapsed_time.sec = elapsed_time_s
-                mtr_drv_pwr.value = False
-                machine.lock.state.set_paused_opening()
-                machine.door_transition_state.set_none()
-                machine.lock.motor.throttle = None
+                machine.sleep_duration_s = machine.lock.reverse(False, LOCK_CLOSE_THROTTLE, LOCK_MIN_TRANSITION_TIME_S,
+                                                                elapsed_time_s)
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_paused_opening:
                 print("lock 10")
                 machine.sleep_duration_s = machine.lock.elapsed_time.sec
+                machine.lock.elapsed_time.sec = LOCK_MIN_TRANSITION_TIME_S - machine.sleep_duration_s
                 machine.lock.state.set_closing()
-                machine.lock.motor.throttle = LOCK_CLOSE_THROTTLE
+                machine.lock.throttle = LOCK_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.lock.state.is_paused_closing:
                 print("lock 11")
                 machine.sleep_duration_s = LOCK_MIN_TRANSITION_TIME_S - machine.lock.elapsed_time.sec
                 machine.lock.state.set_closing()
-                machine.lock.motor.throttle = LOCK_CLOSE_THROTTLE
+                machine.lock.throttle = LOCK_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
 
 
@@ -666,7 +1357,6 @@ class ServiceDoor(State):
         State.exit(self, machine)
 
     def execute(self, machine: StateMachine):
-        mtr_drv_pwr.value = True
         elapsed_time_s = machine.door.elapsed_time.sec + time.monotonic() - machine.go_to_sleep_time
         print("time after sleep: {}".format(time.monotonic()))
         print("elapsed time: {}".format(elapsed_time_s))
@@ -677,7 +1367,7 @@ class ServiceDoor(State):
                 machine.door.elapsed_time.sec = 0.0
                 machine.door.state.set_opening()
                 machine.sleep_duration_s = DOOR_MIN_TRANSITION_TIME_S
-                machine.door.motor.throttle = DOOR_OPEN_THROTTLE
+                machine.door.throttle = DOOR_OPEN_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.door.state.is_opening and elapsed_time_s < DOOR_MIN_TRANSITION_TIME_S:
                 print("door 1")
@@ -689,27 +1379,25 @@ class ServiceDoor(State):
                 machine.door.elapsed_time.sec = 0.0
                 machine.door.state.set_open()
                 machine.door_transition_state.set_none()
-                machine.door.motor.throttle = None
+                machine.door.throttle = None
                 machine.go_to_state("waiting")
             elif machine.door.state.is_closing:
                 print("door 3")
-                mtr_drv_pwr.value = False
-                machine.door.elapsed_time.sec = elapsed_time_s
-                machine.door.state.set_paused_closing()
-                machine.door_transition_state.set_none()
-                machine.door.motor.throttle = None
+                machine.sleep_duration_s = machine.door.reverse(True, DOOR_OPEN_THROTTLE, DOOR_MIN_TRANSITION_TIME_S,
+                                                                elapsed_time_s)
                 machine.go_to_state("waiting")
             elif machine.door.state.is_paused_closing:
                 print("door 4")
                 machine.sleep_duration_s = machine.door.elapsed_time.sec
+                machine.door.elapsed_time.sec = DOOR_MIN_TRANSITION_TIME_S - machine.sleep_duration_s
                 machine.door.state.set_opening()
-                machine.door.motor.throttle = DOOR_OPEN_THROTTLE
+                machine.door.throttle = DOOR_OPEN_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.door.state.is_paused_opening:
                 print("door 5")
                 machine.sleep_duration_s = DOOR_MIN_TRANSITION_TIME_S - machine.door.elapsed_time.sec
                 machine.door.state.set_opening()
-                machine.door.motor.throttle = DOOR_OPEN_THROTTLE
+                machine.door.throttle = DOOR_OPEN_THROTTLE
                 machine.go_to_state("waiting")
         elif machine.door_transition_state.is_close:
             if machine.door.state.is_open:
@@ -717,7 +1405,7 @@ class ServiceDoor(State):
                 machine.door.elapsed_time.sec = 0.0
                 machine.door.state.set_closing()
                 machine.sleep_duration_s = DOOR_MIN_TRANSITION_TIME_S
-                machine.door.motor.throttle = DOOR_CLOSE_THROTTLE
+                machine.door.throttle = DOOR_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.door.state.is_closing and elapsed_time_s < DOOR_MIN_TRANSITION_TIME_S:
                 print("door 7")
@@ -728,30 +1416,78 @@ class ServiceDoor(State):
                 print("door 8")
                 machine.door.elapsed_time.sec = 0.0
                 machine.door.state.set_closed()
-                machine.door.motor.throttle = None
+                machine.door.throttle = None
                 machine.go_to_state("service_lock")
             elif machine.door.state.is_opening:
                 print("door 9")
-                mtr_drv_pwr.value = False
-                machine.door.elapsed_time.sec = elapsed_time_s
-                machine.door.state.set_paused_opening()
-                machine.door_transition_state.set_none()
-                machine.door.motor.throttle = None
+                machine.sleep_duration_s = machine.door.reverse(False, DOOR_CLOSE_THROTTLE, DOOR_MIN_TRANSITION_TIME_S,
+                                                                elapsed_time_s)
                 machine.go_to_state("waiting")
             elif machine.door.state.is_paused_opening:
                 print("door 10")
                 machine.sleep_duration_s = machine.door.elapsed_time.sec
+                machine.door.elapsed_time.sec = DOOR_MIN_TRANSITION_TIME_S - machine.sleep_duration_s
                 machine.door.state.set_closing()
-                machine.door.motor.throttle = DOOR_CLOSE_THROTTLE
+                machine.door.throttle = DOOR_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
             elif machine.door.state.is_paused_closing:
                 print("door 11")
                 machine.sleep_duration_s = DOOR_MIN_TRANSITION_TIME_S - machine.door.elapsed_time.sec
                 machine.door.state.set_closing()
-                machine.door.motor.throttle = DOOR_CLOSE_THROTTLE
+                machine.door.throttle = DOOR_CLOSE_THROTTLE
                 machine.go_to_state("waiting")
 
 
+class BenchCycle(State):
+    """Command the next open/close of an endurance bench run, or report when done"""
+
+    def __init__(self):
+        super().__init__()
+
+    @property
+    def name(self):
+        return "bench"
+
+    def enter(self, machine):
+        State.enter(self, machine)
+
+    def exit(self, machine):
+        State.exit(self, machine)
+
+    def execute(self, machine: StateMachine):
+        bench = machine.bench
+        now = time.monotonic()
+        bench.wake_time = now
+
+        if bench.cycle:
+            # reversals drive straight back, so the parts are always settled at the target here
+            bench.motion.add(now - bench.cycle_start_time)
+            bench.rail_on.add(machine.motor_rail.on_s - bench.cycle_rail_on_s)
+
+        if bench.cycle == bench.cycles:
+            bench.report()
+            bench.is_active = False
+            machine.go_to_state("waiting")
+            return
+
+        bench.cycle += 1
+        bench.is_reversed = False
+        bench.target_open = not machine.door.state.is_open
+        bench.cycle_start_time = now
+        bench.cycle_rail_on_s = machine.motor_rail.on_s
+        bench.command_time = now
+        print("bench cycle {} of {}".format(bench.cycle, bench.cycles))
+        self._command(machine, bench.target_open)
+
+    @staticmethod
+    def _command(machine: StateMachine, target_open: bool):
+        if target_open:
+            machine.door_transition_state.set_open()
+        else:
+            machine.door_transition_state.set_close()
+        machine.go_to_state("wake_up")
+
+
 class RecoverFromImproperReset(State):
     """"""
 
@@ -769,11 +1505,17 @@ class RecoverFromImproperReset(State):
         super().exit(machine)
 
     def execute(self, machine: StateMachine):
+        if machine.overrun_log.count:
+            print("watchdog overruns: {} ({} in a row), last in state id {}".format(machine.overrun_log.count,
+                                                                                   machine.overrun_log.streak,
+                                                                                   machine.overrun_log.state_id))
+
         if machine.ram_state:
             print("ram retained, we good")
             # if ram still retained just resume whatever was happening before the improper reset
             if machine.door_transition_state.is_none:
-                machine.go_to_state("waiting")
+                # a switch edge or alarm the reset cut short is still pending
+                machine.go_to_state("get_reason_for_wake_up")
             else:
                 machine.go_to_state("wake_up")
         else:
@@ -781,10 +1523,9 @@ class RecoverFromImproperReset(State):
             # if ram was lost, figure out what state the door should be in based on alarms and attempt to move it to
             # that position
             machine.ram_state.set_retained()
-            machine.rtc.alarm1_interrupt = True  # not sure this is needed
-            machine.rtc.alarm2_interrupt = True  # not sure this is needed
-            dt = machine.rtc.datetime
+            dt = machine.timekeeper.datetime
             schedule = load_schedule()
+            machine.timekeeper.arm(dt, schedule)  # the mcu backend lost its alarms with the ram
 
             today_alarm1 = alarm_builder(dt, schedule, "open", "today")
             today_alarm2 = alarm_builder(dt, schedule, "close", "today")
@@ -817,35 +1558,76 @@ class Error(State):
     def exit(self, machine):
         super().exit(machine)
 
-    def execute(self, machine):
-        led.value = True
-        time.sleep(1)
-        led.value = False
-        time.sleep(1)
+    def execute(self, machine: StateMachine):
+        for _ in range(ERROR_BLINKS):
+            machine.supervise(2 * ERROR_BLINK_S + WATCHDOG_BUDGET_S)
+            led.value = True
+            time.sleep(ERROR_BLINK_S)
+            led.value = False
+            time.sleep(ERROR_BLINK_S)
+
+        # don't stay awake blinking forever, a switch flip or the next open/close time tries again
+        print("error, deep sleeping")
+        machine.prepare_deep_sleep()
+        sleep_until_pin_alarm(*(machine.timekeeper.sleep_alarms() or []))
 
 
 # MAIN
-duck_coop = StateMachine()
-duck_coop.add_state(Initialize())
-duck_coop.add_state(Waiting())
-duck_coop.add_state(WakeUp())
-duck_coop.add_state(GetReasonForWakeUp())
-duck_coop.add_state(ServiceRtc())
-duck_coop.add_state(ServiceLock())
-duck_coop.add_state(ServiceDoor())
-duck_coop.add_state(RecoverFromImproperReset())
-duck_coop.add_state(Error())
-
-if alarm.wake_alarm is None:  # no alarm cause restart of code
-    if duck_coop.rtc.datetime.tm_year == 2000:
-        duck_coop.go_to_state("initialize")
-        duck_coop.execute()
-    else:  # unintentional restart happened
-        duck_coop.go_to_state("recover_from_improper_reset")
-        duck_coop.execute()
-else:  # pin alarm caused restart of code
-    led.value = True
-    duck_coop.go_to_state("get_reason_for_wake_up")
+def shut_down_and_reset(overruns: OverrunLog, err: Exception):
+    """Cut the motor rail, record the overrun and reset into the recover_from_improper_reset path"""
+    mtr_drv_pwr.value = False
+    print("overrun: {}".format(repr(err)))
+    overruns.record()
+    microcontroller.reset()
+
+
+if TESTING:
+    # time since the chip started covers compiling or importing the firmware, compared across tools/build.py variants
+    gc.collect()
+    print("BUILD variant={} ready_ms={} mem_free={}".format(BUILD_VARIANT, ticks_ms(), gc.mem_free()))
+
+overrun_log = OverrunLog(ram_idx_count=OVERRUN_COUNT_RAM_IDX,
+                         ram_idx_streak=OVERRUN_STREAK_RAM_IDX,
+                         ram_idx_state=OVERRUN_STATE_RAM_IDX,
+                         ram_idx_current_state=CURRENT_STATE_RAM_IDX)
+if microcontroller.cpu.reset_reason == microcontroller.ResetReason.WATCHDOG and \
+        overrun_log.current_state_id != DEEP_SLEEP_STATE_ID:
+    overrun_log.record()
+overrun_log.enter(START_UP_STATE_ID)
+if alarm.wake_alarm is None and overrun_log.streak >= OVERRUN_BACKOFF_COUNT:
+    # a fault that comes back at every start up (no DS3231, broken schedule) would reset us forever
+    print("{} overruns in a row, deep sleeping until the wake pin".format(overrun_log.streak))
+    sleep_until_pin_alarm()
 
-while True:
-    duck_coop.execute()
+try:
+    duck_coop = StateMachine()
+    duck_coop.add_state(Initialize())
+    duck_coop.add_state(Waiting())
+    duck_coop.add_state(WakeUp())
+    duck_coop.add_state(GetReasonForWakeUp())
+    duck_coop.add_state(SettleWakeEvents())
+    duck_coop.add_state(ServiceRtc())
+    duck_coop.add_state(ServiceLock())
+    duck_coop.add_state(ServiceDoor())
+    duck_coop.add_state(BenchCycle())
+    duck_coop.add_state(RecoverFromImproperReset())
+    duck_coop.add_state(Error())
+
+    if alarm.wake_alarm is None:  # no alarm cause restart of code
+        if duck_coop.timekeeper.datetime.tm_year == 2000:
+            duck_coop.go_to_state("initialize")
+            duck_coop.execute()
+        elif bench_strapped():
+            duck_coop.bench.start(BENCH_DEFAULT_CYCLES)
+            duck_coop.go_to_state("bench")
+        else:  # unintentional restart happened
+            duck_coop.go_to_state("recover_from_improper_reset")
+            duck_coop.execute()
+    else:  # pin alarm caused restart of code
+        led.value = True
+        duck_coop.go_to_state("get_reason_for_wake_up")
+
+    while True:
+        duck_coop.execute()
+except Exception as e:  # anything unexpected, a watchdog timeout resets the board by itself
+    shut_down_and_reset(overrun_log, e)
@@ -0,0 +1,176 @@
+"""Build code.py into a small bootstrap plus a precompiled firmware module.
+
+code.py is compiled on the board at every deep sleep wake. The build splits it at the "# MAIN" line:
+
+* duck_coop_fw: everything above, with module level int constants wrapped in micropython.const() so the compiler
+  folds them, optionally with @micropython.native on NATIVE_FUNCTIONS, compiled to .mpy by mpy-cross
+* code.py: a bootstrap that imports duck_coop_fw, then runs the MAIN section unchanged
+
+Three variants are written: "plain" (code.py as it ships today, the baseline), "source" (the split with folded
+constants, duck_coop_fw.py compiled on the board) and "mpy" (the split precompiled). With TESTING set, every variant
+prints a BUILD line when the state machine is about to start: ready_ms, the time since the chip started, covers
+compiling or importing the firmware, mem_free is the RAM left after it. Copy build/<variant>/* to CIRCUITPY, press
+reset (ticks_ms only restarts with the chip), capture the BUILD line of each variant over USB and compare them
+against the plain one:
+
+    python tools/build.py --mpy-cross ~/bin/mpy-cross
+    python tools/build.py --compare plain.log mpy.log source.log
+
+Only int constants can be folded. Throttles and transition times are floats, pins are objects and the sleep memory
+indices are only read when the state machine is built. @micropython.native needs a CircuitPython build with native
+code enabled, which most ports leave off, so --native is opt-in and needs --march. Viper is not used: the hot code
+works on struct_time, dicts and driver objects, where viper has nothing to gain over native.
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+MAIN_MARKER = "# MAIN\n"
+FIRMWARE_MODULE = "duck_coop_fw"
+NATIVE_FUNCTIONS = ("alarm_builder", "next_alarm", "read_switch", "StateMachine.go_to_state", "StateMachine.execute",
+                    "WakeEvents.has", "WakeEvents.target_open")
+INT_CONSTANT = re.compile(r"^([A-Z][A-Z0-9_]*) = (-?\d+)(\s*#.*)?$")
+VARIANT_LINE = 'BUILD_VARIANT = "plain"'
+BOOTSTRAP = '''# generated by tools/build.py from code.py, edit code.py instead
+from {module} import *  # noqa: F401,F403
+
+
+'''
+
+
+def fold_constants(source: str):
+    """Wrap module level int constants in const(), returns the new source and the folded names"""
+    lines = []
+    folded = []
+    for line in source.split("\n"):
+        match = INT_CONSTANT.match(line)
+        if match:
+            if not folded:
+                lines.append("from micropython import const")
+            line = "{} = const({}){}".format(match.group(1), match.group(2), match.group(3) or "")
+            folded.append(match.group(1))
+        lines.append(line)
+
+    return "\n".join(lines), folded
+
+
+def add_native(source: str, functions: tuple):
+    """Decorate the given functions ("name" or "Class.method") with @micropython.native"""
+    lines = source.split("\n")
+    for function in functions:
+        class_name, _, name = function.rpartition(".")
+        indent = "    " if class_name else ""
+        in_class = not class_name
+        for idx, line in enumerate(lines):
+            if class_name and line.startswith("class "):
+                in_class = line.startswith("class {}(".format(class_name))
+            if in_class and line.startswith("{}def {}(".format(indent, name)):
+                lines.insert(idx, "{}@micropython.native".format(indent))
+                break
+        else:
+            raise ValueError("{} not found".format(function))
+
+    lines.insert(0, "import micropython")
+    return "\n".join(lines)
+
+
+def build(code_path: str, out_dir: str, variant: str, native: bool, mpy_cross: str, march: str):
+    with open(code_path, "r") as code_obj:
+        source = code_obj.read()
+    if VARIANT_LINE not in source:
+        raise ValueError("{} not found".format(VARIANT_LINE))
+
+    variant_dir = os.path.join(out_dir, variant)
+    os.makedirs(variant_dir, exist_ok=True)
+    if variant == "plain":
+        firmware, folded = source, []
+        with open(os.path.join(variant_dir, "code.py"), "w") as plain_obj:
+            plain_obj.write(source)
+    else:
+        firmware, main = source.replace(VARIANT_LINE, 'BUILD_VARIANT = "{}"'.format(variant)).split(MAIN_MARKER, 1)
+        firmware, folded = fold_constants(firmware)
+        if native:
+            firmware = add_native(firmware, NATIVE_FUNCTIONS)
+        compile(firmware, FIRMWARE_MODULE + ".py", "exec")  # syntax check on the host
+
+        module_path = os.path.join(variant_dir, FIRMWARE_MODULE + ".py")
+        with open(module_path, "w") as module_obj:
+            module_obj.write(firmware)
+        with open(os.path.join(variant_dir, "code.py"), "w") as bootstrap_obj:
+            bootstrap_obj.write(BOOTSTRAP.format(module=FIRMWARE_MODULE) + MAIN_MARKER + main)
+    for data_file in ("schedule.json", "calibration.json"):
+        data_path = os.path.join(os.path.dirname(os.path.abspath(code_path)), data_file)
+        if os.path.exists(data_path):
+            shutil.copy(data_path, variant_dir)
+
+    report = {"variant": variant, "folded": len(folded), "source_bytes": len(firmware.encode())}
+    if variant == "mpy":
+        command = [mpy_cross]
+        if native:
+            command.append("-march={}".format(march))
+        start = time.monotonic()
+        subprocess.run(command + [module_path], check=True)
+        report["host_compile_s"] = time.monotonic() - start
+        os.remove(module_path)
+        report["mpy_bytes"] = os.path.getsize(os.path.join(variant_dir, FIRMWARE_MODULE + ".mpy"))
+    return report
+
+
+def read_build_line(log_path: str):
+    with open(log_path, "r") as log_obj:
+        for line in log_obj:
+            if line.startswith("BUILD "):
+                return dict(field.split("=") for field in line.split()[1:])
+    raise ValueError("no BUILD line in {}".format(log_path))
+
+
+def compare(plain_log: str, other_logs: list):
+    """Print the BUILD lines of the other variants against the plain code.py"""
+    plain = read_build_line(plain_log)
+    others = [read_build_line(log_path) for log_path in other_logs]
+    print("{:<12} {:>10}".format("per wake", plain["variant"]) +
+          "".join(" {:>10} {:>10}".format(other["variant"], "saved") for other in others))
+    for key, sign in (("ready_ms", 1), ("mem_free", -1)):  # less time and more free RAM is better
+        print("{:<12} {:>10}".format(key, plain[key]) +
+              "".join(" {:>10} {:>10}".format(other[key], sign * (int(plain[key]) - int(other[key])))
+                      for other in others))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--code", default="code.py", help="firmware to build")
+    parser.add_argument("--out", default="build", help="output directory")
+    parser.add_argument("--variant", choices=("plain", "source", "mpy", "all"), default="all")
+    parser.add_argument("--native", action="store_true", help="emit NATIVE_FUNCTIONS as native code")
+    parser.add_argument("--march", default="xtensawin", help="mpy-cross architecture for --native")
+    parser.add_argument("--mpy-cross", default="mpy-cross", help="mpy-cross matching the CircuitPython version")
+    parser.add_argument("--compare", nargs="+", metavar="LOG",
+                        help="compare the BUILD lines captured from the variants, the plain one first, instead of "
+                             "building")
+    args = parser.parse_args()
+
+    if args.compare:
+        if len(args.compare) < 2:
+            parser.error("--compare needs the plain log and at least one other")
+        compare(args.compare[0], args.compare[1:])
+        return
+
+    variants = ("plain", "source", "mpy") if args.variant == "all" else (args.variant,)
+    if "mpy" in variants and shutil.which(args.mpy_cross) is None:
+        sys.exit("{} not found, get the one matching your CircuitPython version or use --variant source"
+                 .format(args.mpy_cross))
+
+    for variant in variants:
+        report = build(args.code, args.out, variant, args.native, args.mpy_cross, args.march)
+        print("{variant}: {folded} constants folded, {source_bytes} source bytes".format(**report), end="")
+        if variant == "mpy":
+            print(", {mpy_bytes} mpy bytes, host compile {host_compile_s:.3f} s".format(**report), end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
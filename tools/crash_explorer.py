@@ -0,0 +1,137 @@
+"""Cut power after every sleep memory write and motor command of a door move and report how code.py recovers.
+
+Each scenario provisions an emulated board (see emulator.py), flips the manual switch and counts the steps of the
+uninterrupted move. Then it replays the move once per step, cutting power right after that step, and boots again
+into recover_from_improper_reset until the board deep sleeps. Sleep memory is either retained (brownout or watchdog
+style reset) or cleared (real power loss).
+
+For every cut it reports the states code.py ends in, where the door and lock physically are, the motor on seconds
+beyond the uninterrupted move and the time from the cut to deep sleep. A path that ends in the error state, gets stuck
+or loops through resets never recovers, its recovery time is shown as "-" (null in the json).
+
+    python tools/crash_explorer.py --max-extra-motor-s 2 --max-recovery-s 30
+
+Exits with 1 when a threshold is exceeded, or with --strict when any path does not end consistent at the target.
+"""
+import argparse
+import json
+import sys
+
+from emulator import provisioned
+
+MAX_BOOTS = 5  # boots after a cut before calling it a reset loop
+VERDICTS = ("ok", "not at target", "inconsistent", "error", "stuck", "reset loop")  # from best to worst
+
+
+def run_move(code_path: str, target_open: bool, cut_at: int = None, clear_memory: bool = False):
+    """Flip the switch towards target_open and run until the board settles, cutting power after step cut_at"""
+    hardware = provisioned(code_path, is_open=not target_open)
+    hardware.switch = target_open == hardware.constants["MANUAL_SWITCH_OPEN"]
+    hardware.cut_at = cut_at
+
+    result = {"cut_step": None, "cut_state": None, "cut_time": None}
+    outcome = hardware.boot("pin")
+    boots = 0
+    while outcome in ("power_cut", "reset") and boots < MAX_BOOTS:
+        if outcome == "power_cut":
+            result.update(cut_step=hardware.last_step, cut_state=hardware.state_name or "(start up)",
+                          cut_time=hardware.now)
+            hardware.power_cut(clear_memory)
+            hardware.cut_at = None
+        boots += 1
+        outcome = hardware.boot()
+    if outcome in ("power_cut", "reset"):
+        outcome = "reset loop"
+
+    states = hardware.logical_states()
+    target = "open" if target_open else "closed"
+    physical = {name: part.physical_state for name, part in hardware.parts.items()}
+    if outcome != "deep_sleep":
+        verdict = outcome
+    elif states is None or states["lock"] != physical["lock"] or states["door"] != physical["door"]:
+        verdict = "inconsistent"
+    elif physical["lock"] != target or physical["door"] != target:
+        verdict = "not at target"
+    else:
+        verdict = "ok"
+
+    result.update(outcome=outcome, verdict=verdict, states=states, physical=physical, steps=hardware.steps,
+                  motor_on_s=hardware.motor_on_s, end_time=hardware.now)
+    return result
+
+
+def format_recovery(recovery_s):
+    return "-" if recovery_s is None else "{:.2f} s".format(recovery_s)
+
+
+def explore(code_path: str, target_open: bool, clear_memory: bool):
+    baseline = run_move(code_path, target_open)
+    results = []
+    for cut_at in range(1, baseline["steps"] + 1):
+        result = run_move(code_path, target_open, cut_at, clear_memory)
+        result["extra_motor_on_s"] = result["motor_on_s"] - baseline["motor_on_s"]
+        if result["outcome"] == "deep_sleep":
+            result["recovery_s"] = result["end_time"] - result["cut_time"]
+        else:
+            result["recovery_s"] = None  # unbounded, the end time is only where the emulator gave up
+        results.append(result)
+    return baseline, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--code", default="code.py", help="firmware to explore")
+    parser.add_argument("--scenario", choices=("open", "close", "both"), default="both")
+    parser.add_argument("--memory", choices=("retained", "cleared", "both"), default="both")
+    parser.add_argument("--max-extra-motor-s", type=float, help="fail when a cut costs more extra motor on time")
+    parser.add_argument("--max-recovery-s", type=float, help="fail when a recovery takes longer")
+    parser.add_argument("--strict", action="store_true", help="fail when any path does not end ok")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    args = parser.parse_args()
+
+    scenarios = {"open": [True], "close": [False], "both": [True, False]}[args.scenario]
+    memories = {"retained": [False], "cleared": [True], "both": [False, True]}[args.memory]
+
+    report = []
+    failed = False
+    for target_open in scenarios:
+        for clear_memory in memories:
+            name = "{} {}".format("open" if target_open else "close", "cleared" if clear_memory else "retained")
+            baseline, results = explore(args.code, target_open, clear_memory)
+            report.append({"scenario": name, "baseline": baseline, "cuts": results})
+            if args.json:
+                continue
+
+            print("{}: {} steps, {:.2f} motor-s, {}".format(name, baseline["steps"], baseline["motor_on_s"],
+                                                            baseline["verdict"]))
+            for idx, result in enumerate(results):
+                print("  #{:<3} {:<28} {:<28} -> {:<42} {:<14} {:+6.2f} motor-s  recovery {:>8}".format(
+                    idx + 1, result["cut_step"], result["cut_state"],
+                    "lock {lock} door {door} transition {transition}".format(**result["states"])
+                    if result["states"] else "-",
+                    result["verdict"], result["extra_motor_on_s"], format_recovery(result["recovery_s"])))
+            recoveries = [result["recovery_s"] for result in results]
+            print("  worst: {}, {:+.2f} motor-s, recovery {}, {} of {} not ok".format(
+                max((result["verdict"] for result in results), key=VERDICTS.index),
+                max(result["extra_motor_on_s"] for result in results),
+                format_recovery(None if None in recoveries else max(recoveries)),
+                sum(result["verdict"] != "ok" for result in results), len(results)))
+
+    for scenario in report:
+        for result in scenario["cuts"]:
+            if args.max_extra_motor_s is not None and result["extra_motor_on_s"] > args.max_extra_motor_s:
+                failed = True
+            if args.max_recovery_s is not None and (result["recovery_s"] is None or
+                                                    result["recovery_s"] > args.max_recovery_s):
+                failed = True
+            if args.strict and result["verdict"] != "ok":
+                failed = True
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
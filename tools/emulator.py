@@ -0,0 +1,503 @@
+"""Emulated CircuitPython hardware for running code.py on the host.
+
+code.py runs unmodified, its hardware imports (alarm, board, digitalio, gc, microcontroller, rtc, supervisor, time,
+watchdog, adafruit_ds3231, adafruit_motorkit) are replaced by emulations bound to one Hardware object. Hardware is
+the physical world that outlives a boot: a virtual clock, sleep memory, nvm, the DS3231, the manual switch, the motor
+rail and the door and lock positions.
+
+Time only moves when code.py sleeps or reads time.monotonic() (AWAKE_STEP_S per read, standing in for execution
+time), so runs are fast and deterministic. DS3231 alarms never fire by themselves, scenarios drive the board with
+the manual switch.
+"""
+import ast
+import builtins
+import calendar
+import os
+import time as host_time
+import types
+
+AWAKE_STEP_S = 0.001  # virtual time per time.monotonic() read
+BOOT_S = 0.5  # time.monotonic() when code.py starts, it restarts at every boot
+LIGHT_SLEEP_OVERSHOOT_S = 0.002  # light sleep wakes this late
+MOTOR_PARTS = {"motor1": "door", "motor2": "lock"}  # MotorKit motor wired to each part, as in StateMachine
+MCU_CLOCK_START = calendar.timegm((2000, 1, 1, 0, 0, 0))  # CircuitPython clock after power up
+NVM_BYTES = 8192  # microcontroller.nvm size of an ESP32-S2/S3 board
+
+
+class PowerCut(BaseException):
+    """Raised after the write chosen by Hardware.cut_at"""
+
+
+class DeepSleep(BaseException):
+    """code.py went to deep sleep, the boot is over"""
+
+
+class Reset(BaseException):
+    """code.py called microcontroller.reset() or the watchdog reset the board"""
+
+
+class Stuck(BaseException):
+    """code.py ran out of virtual time or prints, waited for input or looped in the error state"""
+
+
+def read_constants(code_path: str):
+    """Module level literal constants of code.py, board pins as their name (board.A0 -> "A0")"""
+    with open(code_path, "r") as code_obj:
+        tree = ast.parse(code_obj.read())
+
+    constants = {}
+    for node in tree.body:
+        if not isinstance(node, ast.Assign) or len(node.targets) != 1 or not isinstance(node.targets[0], ast.Name):
+            continue
+        if isinstance(node.value, ast.Attribute) and isinstance(node.value.value, ast.Name) and \
+                node.value.value.id == "board":
+            constants[node.targets[0].id] = node.value.attr
+            continue
+        try:
+            constants[node.targets[0].id] = ast.literal_eval(node.value)
+        except ValueError:
+            pass
+
+    return constants
+
+
+class Part(object):
+    """Door or lock, position in full throttle seconds from closed (0) to open (travel_s)"""
+
+    def __init__(self, name: str, travel_s: float):
+        self.name = name
+        self.travel_s = travel_s
+        self.position_s = 0.0
+        self.throttle = None
+        self.on_s = 0.0  # time driven with the rail powered
+
+    def advance(self, dt: float, is_powered: bool):
+        if not self.throttle or not is_powered:
+            return  # coasting, braking or unpowered
+        self.on_s += dt
+        # a negative throttle opens, the part stalls against the end stops
+        self.position_s = min(max(self.position_s - self.throttle * dt, 0.0), self.travel_s)
+
+    @property
+    def physical_state(self):
+        if self.position_s <= 0.05:
+            return "closed"
+        if self.position_s >= self.travel_s - 0.05:
+            return "open"
+        return "{:.0f}% open".format(100 * self.position_s / self.travel_s)
+
+
+class Hardware(object):
+    """The physical board, motors and coop, booted any number of times"""
+
+    def __init__(self, code_path: str = "code.py", start: tuple = (2026, 6, 15, 12, 0, 0), max_boot_s: float = 600.0,
+                 max_prints: int = 20000):
+        with open(code_path, "r") as code_obj:
+            self.code = compile(code_obj.read(), code_path, "exec")
+        self.constants = read_constants(code_path)
+        self.drive = os.path.dirname(os.path.abspath(code_path))  # CIRCUITPY root
+        self.max_boot_s = max_boot_s
+        self.max_prints = max_prints
+
+        self.now = 0.0
+        self.ds3231_offset = calendar.timegm(start)
+        self.ds3231 = {"alarm1": None, "alarm2": None, "alarm1_status": False, "alarm2_status": False,
+                       "alarm1_interrupt": False, "alarm2_interrupt": False}
+        self.mcu_offset = MCU_CLOCK_START
+        self.sleep_memory = bytearray(256)
+        self.nvm = bytearray(b"\xff" * NVM_BYTES)  # flash, survives power loss
+        self.switch = False
+        self.switch_flips = []  # (time, value) pending manual switch flips
+        self.rail = False
+        self.rail_on_s = 0.0
+        self.parts = {"door": Part("door", self.constants["DOOR_MIN_TRANSITION_TIME_S"]),
+                      "lock": Part("lock", self.constants["LOCK_MIN_TRANSITION_TIME_S"])}
+        self.inputs = []  # lines returned by input()
+        self.throttle_writes = []  # (time, part, throttle)
+
+        self.steps = 0  # sleep memory writes and motor commands so far
+        self.cut_at = None  # step after which power is cut
+        self.last_step = ""
+
+        self.namespace = {}
+        self.state_name = None
+        self.output = []
+        self.boot_time = 0.0
+        self.prints = 0
+        self.watchdog_mode = None
+        self.watchdog_timeout = 0.0
+        self.watchdog_fed = 0.0
+        self.reset_reason = "POWER_ON"  # microcontroller.cpu.reset_reason at the next boot
+
+    # physical world
+    def step(self, description: str):
+        self.steps += 1
+        self.last_step = description
+        if self.cut_at == self.steps:
+            raise PowerCut(description)
+
+    def advance(self, dt: float):
+        for part in self.parts.values():
+            part.advance(dt, self.rail)
+        if self.rail:
+            self.rail_on_s += dt
+        self.now += dt
+        if self.now - self.boot_time > self.max_boot_s:
+            raise Stuck("no deep sleep after {} s in {}".format(self.max_boot_s, self.state_name))
+        if self.watchdog_mode is not None and self.now - self.watchdog_fed > self.watchdog_timeout:
+            if self.watchdog_mode == "reset":
+                self.watchdog_mode = None
+                self.reset_reason = "WATCHDOG"
+                raise Reset()
+            self.watchdog_mode = None
+            raise self.modules["watchdog"].WatchDogTimeout()
+
+    def flip_switch_at(self, at_s: float, value: bool):
+        self.switch_flips.append((at_s, value))
+        self.switch_flips.sort()
+
+    def power_cut(self, clear_memory: bool):
+        """Everything stops, sleep memory survives a brownout style reset but not a real power loss"""
+        self.rail = False
+        for part in self.parts.values():
+            part.throttle = None
+        self.mcu_offset = MCU_CLOCK_START - self.now
+        self.watchdog_mode = None
+        self.reset_reason = "POWER_ON"
+        if clear_memory:
+            self.sleep_memory[:] = bytes(len(self.sleep_memory))
+
+    @property
+    def motor_on_s(self):
+        return sum(part.on_s for part in self.parts.values())
+
+    # running code.py
+    def boot(self, wake_alarm=None):
+        """Run code.py until it deep sleeps or the boot ends otherwise, returns how it ended"""
+        self.boot_time = self.now
+        self.prints = 0
+        self.state_name = None
+        self.watchdog_mode = None
+        self.modules = self._modules(wake_alarm)
+        self.reset_reason = "SOFTWARE"  # until the boot ends some other way
+
+        def _import(name, globals=None, locals=None, fromlist=(), level=0):
+            if name in self.modules:
+                return self.modules[name]
+            return builtins.__import__(name, globals, locals, fromlist, level)
+
+        board_builtins = dict(vars(builtins))
+        board_builtins.update({"__import__": _import, "print": self._print, "input": self._input, "open": self._open})
+        self.namespace = {"__name__": "__main__", "__builtins__": board_builtins}
+        try:
+            exec(self.code, self.namespace)
+        except DeepSleep:
+            self.reset_reason = "DEEP_SLEEP_ALARM"
+            return "error" if self.state_name == "error" else "deep_sleep"
+        except PowerCut:
+            return "power_cut"
+        except Reset:
+            return "reset"
+        except Stuck as err:
+            self.output.append("stuck: {}".format(err))
+            return "error" if self.state_name == "error" else "stuck"
+        return "stuck"  # code.py never returns on the board
+
+    def _print(self, *args, **kwargs):
+        line = " ".join(str(arg) for arg in args)
+        self.output.append(line)
+        if line.startswith("Entering "):
+            self.state_name = line[len("Entering "):]
+        self.prints += 1
+        if self.prints > self.max_prints:
+            raise Stuck("{} prints without deep sleep in {}".format(self.max_prints, self.state_name))
+
+    def _open(self, path: str, mode: str = "r"):
+        """Files from next to code.py, read-only like CIRCUITPY while USB has it mounted"""
+        if "r" not in mode or "+" in mode:
+            raise OSError(30, "Read-only filesystem")
+        return open(os.path.join(self.drive, path.lstrip("/")), mode)
+
+    def _input(self, prompt: str = ""):
+        self.output.append(prompt)
+        if not self.inputs:
+            raise Stuck("waiting for input")
+        return self.inputs.pop(0)
+
+    def _modules(self, wake_alarm):
+        hardware = self
+        modules = {}
+
+        # time, the virtual clock
+        vtime = types.ModuleType("time")
+        vtime.struct_time = host_time.struct_time
+
+        def monotonic():
+            hardware.advance(AWAKE_STEP_S)
+            return hardware.now - hardware.boot_time + BOOT_S
+
+        vtime.monotonic = monotonic
+        vtime.sleep = lambda seconds: hardware.advance(seconds)
+        vtime.time = lambda: int(hardware.mcu_offset + hardware.now)
+        vtime.mktime = lambda dt: calendar.timegm(tuple(dt)[:6])
+        vtime.localtime = lambda secs=None: host_time.gmtime(vtime.time() if secs is None else secs)
+        modules["time"] = vtime
+
+        # board and digitalio
+        board = types.ModuleType("board")
+        for pin_name in ("A0", "A1", "A2", "A3", "D5", "D6", "D9", "D10", "D24", "D25", "LED"):
+            setattr(board, pin_name, pin_name)
+        board.I2C = lambda: "i2c"
+        modules["board"] = board
+
+        digitalio = types.ModuleType("digitalio")
+        digitalio.Direction = types.SimpleNamespace(INPUT="input", OUTPUT="output")
+        digitalio.Pull = types.SimpleNamespace(UP="up", DOWN="down")
+        rail_pin = self.constants["MOTOR_DRV_PWR_EN_PIN"]
+        switch_pin = self.constants["MANUAL_SWITCH_STATE_PIN"]
+
+        class DigitalInOut(object):
+            def __init__(self, pin):
+                self.pin = pin
+                self.direction = "input"
+                self.pull = None
+                self._value = False
+
+            @property
+            def value(self):
+                if self.pin == switch_pin:
+                    return hardware.switch
+                if self.pin == rail_pin:
+                    return hardware.rail
+                return self._value if self.direction == "output" else self.pull == "up"
+
+            @value.setter
+            def value(self, value):
+                if self.pin == rail_pin:
+                    hardware.rail = bool(value)
+                self._value = value
+
+            def switch_to_input(self, pull=None):
+                self.direction = "input"
+                self.pull = pull
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+        digitalio.DigitalInOut = DigitalInOut
+        modules["digitalio"] = digitalio
+
+        # supervisor, watchdog, microcontroller, rtc
+        supervisor = types.ModuleType("supervisor")
+        supervisor.runtime = types.SimpleNamespace(serial_connected=False)
+        supervisor.ticks_ms = lambda: int((hardware.now - hardware.boot_time + BOOT_S) * 1000)
+        modules["supervisor"] = supervisor
+
+        gc = types.ModuleType("gc")
+        gc.collect = lambda: None
+        gc.mem_free = lambda: 0  # no heap to measure on the host
+        modules["gc"] = gc
+
+        watchdog = types.ModuleType("watchdog")
+        watchdog.WatchDogMode = types.SimpleNamespace(RAISE="raise", RESET="reset")
+        watchdog.WatchDogTimeout = type("WatchDogTimeout", (Exception,), {})
+        modules["watchdog"] = watchdog
+
+        class WatchDogTimer(object):
+            timeout = property(lambda self: hardware.watchdog_timeout,
+                               lambda self, value: setattr(hardware, "watchdog_timeout", value))
+            mode = property(lambda self: hardware.watchdog_mode,
+                            lambda self, value: setattr(hardware, "watchdog_mode", value))
+
+            def feed(self):
+                hardware.watchdog_fed = hardware.now
+
+            def deinit(self):
+                if hardware.watchdog_mode == "reset":
+                    raise NotImplementedError("WatchDogTimer cannot be deinitialized once mode is set to RESET")
+                hardware.watchdog_mode = None
+
+        def reset():
+            raise Reset()
+
+        microcontroller = types.ModuleType("microcontroller")
+        microcontroller.watchdog = WatchDogTimer()
+        microcontroller.reset = reset
+        microcontroller.nvm = self.nvm
+        microcontroller.ResetReason = types.SimpleNamespace(
+            **{reason: reason for reason in ("POWER_ON", "SOFTWARE", "WATCHDOG", "DEEP_SLEEP_ALARM")})
+        microcontroller.cpu = types.SimpleNamespace(reset_reason=self.reset_reason)
+        modules["microcontroller"] = microcontroller
+
+        class RTC(object):
+            @property
+            def datetime(self):
+                return vtime.localtime()
+
+            @datetime.setter
+            def datetime(self, dt):
+                hardware.mcu_offset = vtime.mktime(dt) - hardware.now
+
+        rtc = types.ModuleType("rtc")
+        rtc.RTC = RTC
+        modules["rtc"] = rtc
+
+        # I2C devices
+        def ds3231_property(key):
+            return property(lambda self: hardware.ds3231[key],
+                            lambda self, value: hardware.ds3231.__setitem__(key, value))
+
+        class DS3231(object):
+            alarm1 = ds3231_property("alarm1")
+            alarm2 = ds3231_property("alarm2")
+            alarm1_status = ds3231_property("alarm1_status")
+            alarm2_status = ds3231_property("alarm2_status")
+            alarm1_interrupt = ds3231_property("alarm1_interrupt")
+            alarm2_interrupt = ds3231_property("alarm2_interrupt")
+
+            def __init__(self, i2c=None):
+                pass
+
+            @property
+            def datetime(self):
+                return host_time.gmtime(int(hardware.ds3231_offset + hardware.now))
+
+            @datetime.setter
+            def datetime(self, dt):
+                hardware.ds3231_offset = vtime.mktime(dt) - hardware.now
+
+        adafruit_ds3231 = types.ModuleType("adafruit_ds3231")
+        adafruit_ds3231.DS3231 = DS3231
+        modules["adafruit_ds3231"] = adafruit_ds3231
+
+        class DCMotor(object):
+            def __init__(self, name):
+                self.name = name
+                self._throttle = None
+
+            @property
+            def throttle(self):
+                return self._throttle
+
+            @throttle.setter
+            def throttle(self, throttle):
+                self._throttle = throttle
+                if self.name in MOTOR_PARTS:
+                    hardware.parts[MOTOR_PARTS[self.name]].throttle = throttle
+                    hardware.throttle_writes.append((hardware.now, MOTOR_PARTS[self.name], throttle))
+                hardware.step("{}.throttle = {}".format(self.name, throttle))
+
+        class MotorKit(object):
+            # properties on the class like the real driver, code.py uses them in annotations
+            motor1 = property(lambda self: self._motors[0])
+            motor2 = property(lambda self: self._motors[1])
+            motor3 = property(lambda self: self._motors[2])
+            motor4 = property(lambda self: self._motors[3])
+
+            def __init__(self, i2c=None):
+                # the PCA9685 is reset, every motor coasts
+                for part in hardware.parts.values():
+                    part.throttle = None
+                self._motors = [DCMotor("motor{}".format(idx)) for idx in range(1, 5)]
+
+        adafruit_motorkit = types.ModuleType("adafruit_motorkit")
+        adafruit_motorkit.MotorKit = MotorKit
+        modules["adafruit_motorkit"] = adafruit_motorkit
+
+        # alarm
+        class SleepMemory(object):
+            def __len__(self):
+                return len(hardware.sleep_memory)
+
+            def __getitem__(self, idx):
+                return hardware.sleep_memory[idx]
+
+            def __setitem__(self, idx, value):
+                hardware.sleep_memory[idx] = value
+                hardware.step("sleep_memory[{}] = {}".format(idx, int(value)))
+
+        class PinAlarm(object):
+            def __init__(self, pin=None, value=False, edge=False, pull=False):
+                self.pin = pin
+
+        class TimeAlarm(object):
+            def __init__(self, monotonic_time=None, epoch_time=None):
+                if epoch_time is not None and epoch_time <= vtime.time():
+                    raise ValueError("Time alarm time is in the past")
+                self.monotonic_time = monotonic_time
+                self.epoch_time = epoch_time
+
+        def light_sleep_until_alarms(*alarms):
+            wake_at = min(alarm.monotonic_time for alarm in alarms if isinstance(alarm, TimeAlarm)) + \
+                hardware.boot_time - BOOT_S + LIGHT_SLEEP_OVERSHOOT_S
+            if hardware.switch_flips and hardware.switch_flips[0][0] < wake_at:
+                flip_at, hardware.switch = hardware.switch_flips.pop(0)
+                woke_by = [alarm for alarm in alarms if isinstance(alarm, PinAlarm)][0]
+                wake_at = flip_at
+            else:
+                woke_by = [alarm for alarm in alarms if isinstance(alarm, TimeAlarm)][0]
+            hardware.advance(max(wake_at - hardware.now, 0.0))
+            alarm_module.wake_alarm = woke_by
+            return woke_by
+
+        def exit_and_deep_sleep_until_alarms(*alarms):
+            raise DeepSleep()
+
+        alarm_module = types.ModuleType("alarm")
+        alarm_module.sleep_memory = SleepMemory()
+        alarm_module.pin = types.SimpleNamespace(PinAlarm=PinAlarm)
+        alarm_module.time = types.SimpleNamespace(TimeAlarm=TimeAlarm)
+        alarm_module.light_sleep_until_alarms = light_sleep_until_alarms
+        alarm_module.exit_and_deep_sleep_until_alarms = exit_and_deep_sleep_until_alarms
+        if wake_alarm == "pin":
+            alarm_module.wake_alarm = PinAlarm()
+        elif wake_alarm == "time":
+            alarm_module.wake_alarm = TimeAlarm()
+        else:
+            alarm_module.wake_alarm = None
+        modules["alarm"] = alarm_module
+
+        return modules
+
+    # state of the booted code.py
+    def logical_states(self):
+        """Door, lock and transition state names code.py holds, None if it never got that far"""
+        machine = self.namespace.get("duck_coop")
+        if machine is None or not hasattr(machine, "door_transition_state"):
+            return None
+
+        def part_state(state):
+            for flag in ("closed", "open", "closing", "opening", "paused_closing", "paused_opening"):
+                if getattr(state, "is_" + flag):
+                    return flag
+            return "?"
+
+        transition = machine.door_transition_state
+        return {"lock": part_state(machine.lock.state),
+                "door": part_state(machine.door.state),
+                "transition": "none" if transition.is_none else "open" if transition.is_open else "close"}
+
+
+def provisioned(code_path: str = "code.py", is_open: bool = False, **kwargs):
+    """Hardware provisioned through the PROV line and asleep, with the switch matching the door"""
+    hardware = Hardware(code_path, **kwargs)
+    hardware.switch = is_open == hardware.constants["MANUAL_SWITCH_OPEN"]
+    start = host_time.gmtime(hardware.ds3231_offset)
+    hardware.ds3231_offset = MCU_CLOCK_START  # a DS3231 that lost its battery reads 2000-01-01
+    hardware.inputs = ['PROV {{"dt": [{}, {}, {}, {}, {}, {}], "door": {}}}'.format(
+        start.tm_year, start.tm_mon, start.tm_mday, start.tm_hour, start.tm_min, start.tm_sec, int(is_open))]
+    if is_open:
+        for part in hardware.parts.values():
+            part.position_s = part.travel_s
+
+    outcome = hardware.boot()
+    if outcome != "deep_sleep":
+        raise RuntimeError("provisioning ended in {}: {}".format(outcome, hardware.output[-5:]))
+    hardware.steps = 0
+    hardware.throttle_writes = []
+    for part in hardware.parts.values():
+        part.on_s = 0.0
+    return hardware
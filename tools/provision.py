@@ -0,0 +1,106 @@
+"""Provision a duck coop controller over USB serial in one round-trip.
+
+The board must be sitting at the initialize prompt (fresh DS3231, year 2000). The host's local time is sent as the
+RTC time, the board derives the weekday itself.
+
+    python tools/provision.py /dev/ttyACM0 --door closed --schedule schedule.json --calibration calibration.json
+
+With --bench-cycles the board starts an endurance bench run right after the setup and stays on USB, the BENCH report
+lines are printed as they arrive:
+
+    python tools/provision.py /dev/ttyACM0 --door closed --bench-cycles 50 --reverse-every 3 --reverse-after-s 2.0
+
+Requires pyserial (pip install pyserial).
+"""
+import argparse
+import json
+import sys
+import time
+
+try:
+    import serial
+except ImportError:
+    serial = None
+
+PROVISION_PREFIX = "PROV "
+BENCH_PREFIX = "BENCH "
+BENCH_LAST_LINE = "BENCH rail_on "  # last line of the bench report
+
+
+def build_payload(door: str, schedule_path: str = None, calibration_path: str = None, bench_cycles: int = None,
+                  reverse_every: int = 0, reverse_after_s: float = 0.0):
+    now = time.localtime()
+    payload = {
+        "dt": [now.tm_year, now.tm_mon, now.tm_mday, now.tm_hour, now.tm_min, now.tm_sec],
+        "door": 1 if door == "open" else 0,
+    }
+    if schedule_path:
+        with open(schedule_path, "r") as sch_obj:
+            payload["schedule"] = json.load(sch_obj)
+    if calibration_path:
+        with open(calibration_path, "r") as cal_obj:
+            payload["calibration"] = json.load(cal_obj)
+    if bench_cycles:
+        payload["bench"] = {"cycles": bench_cycles, "reverse_every": reverse_every, "reverse_after_s": reverse_after_s}
+
+    return payload
+
+
+def provision(port: str, payload: dict, timeout_s: float = 2.0):
+    """Send the provisioning line and return the board's PROV replies, the last one being OK or ERR.
+    With a bench entry in the payload, the BENCH lines of the run follow the OK reply"""
+    line = PROVISION_PREFIX + json.dumps(payload, separators=(",", ":")) + "\r\n"
+    replies = []
+    with serial.Serial(port, 115200, timeout=timeout_s) as ser:
+        ser.reset_input_buffer()
+        ser.write(line.encode())
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            reply = ser.readline().decode(errors="replace").strip()
+            if not reply.startswith(PROVISION_PREFIX):
+                continue  # echo of the sent line or other console output
+            replies.append(reply)
+            if reply.startswith("PROV OK") or reply.startswith("PROV ERR"):
+                break
+
+        if "bench" in payload and replies and replies[-1].startswith("PROV OK"):
+            # the run takes as long as it takes, wait for the end of the report
+            while not replies[-1].startswith(BENCH_LAST_LINE):
+                reply = ser.readline().decode(errors="replace").strip()
+                if reply.startswith(BENCH_PREFIX):
+                    print(reply)
+                    replies.append(reply)
+
+    return replies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("port", help="USB serial port of the board")
+    parser.add_argument("--door", choices=("open", "closed"), required=True, help="current door and lock position")
+    parser.add_argument("--schedule", help="schedule json to install on the board")
+    parser.add_argument("--calibration", help="calibration json to install on the board")
+    parser.add_argument("--bench-cycles", type=int, help="start a bench run of this many open/close cycles")
+    parser.add_argument("--reverse-every", type=int, default=0, help="inject a switch reversal every n-th bench cycle")
+    parser.add_argument("--reverse-after-s", type=float, default=0.0, help="seconds into the cycle of the reversal")
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds to wait for the reply")
+    args = parser.parse_args()
+
+    if serial is None:
+        sys.exit("pyserial is required: pip install pyserial")
+
+    start = time.monotonic()
+    payload = build_payload(args.door, args.schedule, args.calibration, args.bench_cycles, args.reverse_every,
+                            args.reverse_after_s)
+    replies = provision(args.port, payload, args.timeout)
+    prov_replies = [reply for reply in replies if not reply.startswith(BENCH_PREFIX)]
+    for reply in prov_replies:
+        print(reply)
+    print("round-trip: {:.3f} s".format(time.monotonic() - start))
+
+    if not prov_replies or not prov_replies[-1].startswith("PROV OK"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Flip the manual switch at random times during door moves and measure how code.py reacts.
+
+Each run provisions an emulated board (see emulator.py) with the door closed and flips the switch a random number of
+times with random gaps, many of them while the lock or door is moving. For every flip it measures the switch to
+motion latency, from the flip to the first throttle write driving towards the new target. A flip is unanswered when
+no such write follows before the next flip, unless that came within ANSWER_WINDOW_S. It also reports the total motor
+on time and whether the run ends with the door and lock at the last target.
+
+    python tools/reversal_bench.py --runs 200 --seed 1
+
+Run it against another firmware with --code (schedule.json must sit next to it) to compare.
+"""
+import argparse
+import random
+
+from emulator import provisioned
+
+MAX_BOOTS = 50  # boots per run before giving up
+ANSWER_WINDOW_S = 1.0  # a flip followed by the next one sooner than this may go unanswered
+
+
+def run_flips(code_path: str, flip_gaps_s: list):
+    """Run one flip sequence, returns (latencies of answered flips, unanswered flips, motor on s, ended at target)"""
+    hardware = provisioned(code_path, is_open=False)
+    switch_open = hardware.constants["MANUAL_SWITCH_OPEN"]
+    flips = []
+    at_s = hardware.now
+    value = hardware.switch
+    for gap_s in flip_gaps_s:
+        at_s += gap_s
+        value = not value
+        flips.append((at_s, value))
+        hardware.flip_switch_at(at_s, value)
+
+    outcome = "deep_sleep"
+    for _ in range(MAX_BOOTS):
+        if not hardware.switch_flips:
+            break
+        # deep sleep until the next flip wakes the board
+        flip_at, hardware.switch = hardware.switch_flips.pop(0)
+        hardware.advance(max(flip_at - hardware.now, 0.0))
+        outcome = hardware.boot("pin")
+        if outcome != "deep_sleep":
+            break
+
+    latencies = []
+    unanswered = 0
+    for idx, (flip_at, value) in enumerate(flips):
+        next_flip_at = flips[idx + 1][0] if idx + 1 < len(flips) else float("inf")
+        to_open = value == switch_open
+        answers = [write_at for write_at, part, throttle in hardware.throttle_writes
+                   if flip_at <= write_at < next_flip_at and throttle and (throttle < 0) == to_open]
+        if answers:
+            latencies.append(answers[0] - flip_at)
+        elif next_flip_at - flip_at > ANSWER_WINDOW_S:
+            unanswered += 1
+
+    target = "open" if flips[-1][1] == switch_open else "closed"
+    at_target = outcome == "deep_sleep" and all(part.physical_state == target for part in hardware.parts.values())
+    return latencies, unanswered, hardware.motor_on_s, at_target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--code", default="code.py", help="firmware to benchmark")
+    parser.add_argument("--runs", type=int, default=100, help="random flip sequences")
+    parser.add_argument("--max-flips", type=int, default=4, help="most flips per sequence")
+    parser.add_argument("--max-gap-s", type=float, default=12.0, help="longest time between two flips")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    latencies = []
+    unanswered = 0
+    motor_on_s = 0.0
+    at_target = 0
+    for _ in range(args.runs):
+        flip_gaps_s = [rng.uniform(0.1, args.max_gap_s) for _ in range(rng.randint(1, args.max_flips))]
+        flip_gaps_s[0] = 1.0  # first flip from idle
+        run_latencies, run_unanswered, run_motor_on_s, run_at_target = run_flips(args.code, flip_gaps_s)
+        latencies += run_latencies
+        unanswered += run_unanswered
+        motor_on_s += run_motor_on_s
+        at_target += run_at_target
+
+    latencies.sort()
+    print("runs: {}, answered flips: {}, unanswered flips: {}".format(args.runs, len(latencies), unanswered))
+    if latencies:
+        print("switch to motion latency s min/median/p95/max: {:.3f}/{:.3f}/{:.3f}/{:.3f}".format(
+            latencies[0], latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], latencies[-1]))
+    print("motor on s per run: {:.2f}".format(motor_on_s / args.runs))
+    print("runs ending at the last target: {} of {}".format(at_target, args.runs))
+
+
+if __name__ == "__main__":
+    main()